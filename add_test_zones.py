@@ -1,5 +1,6 @@
 import sqlite3
 import os
+import database
 
 def add_test_zones():
     """Добавляем тестовые зеленые зоны с реальными координатами"""
@@ -48,6 +49,12 @@ def add_test_zones():
             (zone_id[0], kovdor_id, 75, 0, 1, 0, 0, 'Состояние хорошее, требуется обрезка', admin_id)
         )
 
+    # Заполняем числовые координаты и пересчитываем агрегаты по зонам, городам и пользователям
+    database.backfill_zone_coordinates(conn)
+    database.rebuild_zone_stats(conn)
+    database.rebuild_city_stats(conn)
+    database.rebuild_user_stats(conn)
+
     conn.commit()
     conn.close()
     print("✅ Тестовые зеленые зоны успешно добавлены!")
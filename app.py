@@ -1,8 +1,24 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session, flash
+import gzip
+import hashlib
+import math
+from flask import Flask, render_template, request, redirect, url_for, jsonify, session, flash, make_response, abort
 import database
 import auth
+import citysearch
 import maps
+import metrics
+import migrations
+import pagecache
+import profiler
+import clusters
+import fulltext
+import geojson
+import ratelimit
+import slowlog
+import streaming
+import tracing
+import zonebin
 import sys
 
 app = Flask(__name__)
@@ -16,6 +32,18 @@ else:
     app.secret_key = 'dev-secret-key-change-in-production'
     print("💻 Запуск в режиме разработки")
 
+# Метрики (/metrics): подключаются первыми, чтобы время запроса включало остальные обработчики
+metrics.init_app(app)
+
+# Профилирование отдельных запросов администратором (?__profile=1)
+profiler.init_app(app)
+
+# Трассировка отобранных запросов (TRACE_SAMPLE_RATE или заголовок traceparent)
+tracing.init_app(app)
+
+# Журнал медленных SQL-запросов с планами выполнения (порог SLOW_QUERY_MS)
+slowlog.enable()
+
 # Инициализация маршрутов аутентификации
 auth.init_auth_routes(app)
 
@@ -35,13 +63,93 @@ def initialize_database():
 
 app.secret_key = 'your-secret-key-here-change-in-production'
 
-# Инициализация маршрутов аутентификации
-auth.init_auth_routes(app)
+# Соединения с БД: пул на воркер и одно соединение на запрос
+database.init_app(app)
 
 # Инициализация базы данных при запуске
 if not os.path.exists('green_city.db'):
     database.init_db()
 
+# Применяем миграции схемы (индексы и новые таблицы) к существующей базе
+migrations.migrate()
+
+
+_asset_versions = {}
+
+
+@app.template_global()
+def asset_url(filename):
+    """URL статического файла с отпечатком содержимого, чтобы его можно было кэшировать надолго"""
+    version = _asset_versions.get(filename)
+    if version is None:
+        with open(os.path.join(app.static_folder, filename), 'rb') as f:
+            version = hashlib.md5(f.read()).hexdigest()[:12]
+        _asset_versions[filename] = version
+    return url_for('static', filename=filename, v=version)
+
+
+@app.after_request
+def cache_fingerprinted_assets(response):
+    """Файлы с отпечатком в URL не меняются, браузер может не перепроверять их год"""
+    if request.endpoint == 'static' and 'v' in request.args and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+    return response
+
+
+@app.errorhandler(ratelimit.RateLimited)
+def rate_limited(error):
+    """Лимит запросов к внешнему сервису исчерпан: сразу 429, без ожидания в воркере"""
+    response = jsonify({
+        'success': False,
+        'message': 'Слишком много запросов к сервису геокодирования, повторите позже'
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(error.retry_after)))
+    return response
+
+
+def versioned_json(version, build, variant=''):
+    """JSON-ответ со строгим ETag из версии данных.
+
+    ETag вычисляется до обращения к БД, поэтому при совпадении If-None-Match
+    build() не вызывается и клиент сразу получает 304. build() возвращает данные
+    для JSON или готовый (например, потоковый) ответ; variant различает
+    представления одного URL (например, сжатое и несжатое).
+    """
+    key = f'{pagecache.deploy_token()}|{version}|{get_user_city()}|{request.full_path}|{variant}'
+    etag = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(build())
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+# Ответы меньше этого размера не сжимаются: выигрыш меньше накладных расходов
+GZIP_MIN_SIZE = 1024
+
+
+def accepts_gzip():
+    """Клиент принимает ответ в gzip"""
+    return 'gzip' in request.accept_encodings
+
+
+def gzip_response(response):
+    """Сжать тело готового (не потокового) ответа, если клиент принимает gzip"""
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or response.is_streamed or not accepts_gzip()
+            or response.content_length is None or response.content_length < GZIP_MIN_SIZE):
+        return response
+    response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
 
 def get_user_city():
     """Получить город текущего пользователя"""
@@ -73,36 +181,25 @@ def admin_required(f):
     return decorated_function
 
 @app.route('/')
+@pagecache.cached_response()
 def index():
     """Главная страница с общей статистикой"""
     user_city = get_user_city()
-    conn = database.get_db_connection()
 
-    if user_city:
-        # Статистика для конкретного города
-        city_stats = conn.execute('''
-            SELECT 
-                COUNT(DISTINCT gz.id) as total_zones,
-                COUNT(CASE WHEN mt.status = "pending" THEN 1 END) as pending_tasks,
-                COUNT(CASE WHEN mt.priority = "high" AND mt.status = "pending" THEN 1 END) as critical_tasks,
-                COALESCE(AVG(zr.health_score), 0) as avg_health,
-                COUNT(DISTINCT o.id) as total_organizations
-            FROM green_zones gz
-            LEFT JOIN maintenance_tasks mt ON gz.id = mt.zone_id
-            LEFT JOIN zone_reports zr ON gz.id = zr.zone_id
-            LEFT JOIN organizations o ON gz.city_id = o.city_id
-            WHERE gz.city_id = (SELECT id FROM cities WHERE name = ?)
-            AND gz.status = 'approved'
-        ''', (user_city,)).fetchone()
+    if not user_city and 'user_id' in session:
+        # Пользователь авторизован, но почему-то нет города в сессии
+        conn = database.get_db_connection()
+        user_city_result = conn.execute('SELECT city FROM users WHERE id = ?', (session['user_id'],)).fetchone()
+        conn.close()
+        if user_city_result:
+            session['city'] = user_city_result['city']
+            return redirect(url_for('index'))
 
-        stats = {
-            'total_zones': city_stats['total_zones'],
-            'pending_tasks': city_stats['pending_tasks'],
-            'critical_tasks': city_stats['critical_tasks'],
-            'avg_health': city_stats['avg_health'],
-            'total_organizations': city_stats['total_organizations'] or 0
-        }
+    # Показатели города (для неавторизованных - по всем городам) из сводки city_stats
+    stats = database.get_dashboard_stats(user_city)
 
+    conn = database.get_db_connection()
+    if user_city:
         # Последние задачи для города
         recent_tasks = conn.execute('''
             SELECT mt.*, gz.name as zone_name 
@@ -113,28 +210,7 @@ def index():
             ORDER BY mt.created_date DESC 
             LIMIT 5
         ''', (user_city,)).fetchall()
-
     else:
-        # Если пользователь не авторизован, показываем общую статистику
-        if 'user_id' in session:
-            # Пользователь авторизован, но почему-то нет города в сессии
-            conn.execute('SELECT city FROM users WHERE id = ?', (session['user_id'],))
-            user_city_result = conn.fetchone()
-            if user_city_result:
-                session['city'] = user_city_result['city']
-                return redirect(url_for('index'))
-
-        # Общая статистика по всем городам для неавторизованных
-        stats = {
-            'total_zones': conn.execute("SELECT COUNT(*) FROM green_zones WHERE status = 'approved'").fetchone()[0],
-            'pending_tasks': conn.execute("SELECT COUNT(*) FROM maintenance_tasks WHERE status = 'pending'").fetchone()[
-                0],
-            'critical_tasks': conn.execute(
-                "SELECT COUNT(*) FROM maintenance_tasks WHERE priority = 'high' AND status = 'pending'").fetchone()[0],
-            'avg_health': conn.execute('SELECT AVG(health_score) FROM zone_reports').fetchone()[0] or 0,
-            'total_organizations': conn.execute("SELECT COUNT(*) FROM organizations WHERE is_active = 1").fetchone()[0]
-        }
-
         recent_tasks = conn.execute('''
             SELECT mt.*, gz.name as zone_name 
             FROM maintenance_tasks mt 
@@ -143,44 +219,18 @@ def index():
             ORDER BY mt.created_date DESC 
             LIMIT 5
         ''').fetchall()
-
     conn.close()
 
     return render_template('index.html', stats=stats, recent_tasks=recent_tasks, user_city=user_city)
 
 
 @app.route('/map')
+@pagecache.cached_response()
 def map_view():
     """Интерактивная карта с зелеными зонами"""
     user_city = get_user_city()
 
-    conn = database.get_db_connection()
-
-    if user_city:
-        zones = conn.execute('''
-            SELECT gz.*, 
-                   COALESCE(AVG(zr.health_score), 0) as avg_health,
-                   COUNT(CASE WHEN mt.status = "pending" THEN 1 END) as pending_tasks
-            FROM green_zones gz
-            LEFT JOIN zone_reports zr ON gz.id = zr.zone_id
-            LEFT JOIN maintenance_tasks mt ON gz.id = mt.zone_id
-            WHERE gz.city_id = (SELECT id FROM cities WHERE name = ?)
-            AND gz.status = 'approved'
-            GROUP BY gz.id
-        ''', (user_city,)).fetchall()
-    else:
-        zones = conn.execute('''
-            SELECT gz.*, 
-                   COALESCE(AVG(zr.health_score), 0) as avg_health,
-                   COUNT(CASE WHEN mt.status = "pending" THEN 1 END) as pending_tasks
-            FROM green_zones gz
-            LEFT JOIN zone_reports zr ON gz.id = zr.zone_id
-            LEFT JOIN maintenance_tasks mt ON gz.id = mt.zone_id
-            WHERE gz.status = 'approved'
-            GROUP BY gz.id
-        ''').fetchall()
-
-    conn.close()
+    zones = database.get_approved_zones_for_city(user_city=user_city)
 
     # Преобразуем Row объекты в словари для удобства
     zones_list = []
@@ -192,72 +242,31 @@ def map_view():
             'area': zone['area'],
             'location': zone['location'],
             'coordinates': zone['coordinates'],
+            'lat': zone['lat'],
+            'lon': zone['lon'],
             'avg_health': zone['avg_health'] or 0,
             'pending_tasks': zone['pending_tasks'] or 0
         })
 
-    print(f"📍 Found {len(zones_list)} zones in database")
-    for zone in zones_list:
-        print(f"📍 Zone: {zone['name']}, Coords: {zone['coordinates']}")
+    # Карта - статичная оболочка, зоны она загружает из API
+    tile = maps.get_tile_layer(maps.DEFAULT_TILE_PROVIDER)
 
-    # Генерируем карту
-    map_html = maps.generate_map_with_zones(zones_list, user_city)
-
-    return render_template('map.html', zones=zones_list, user_city=user_city, map_html=map_html)
+    return render_template('map.html', zones=zones_list, user_city=user_city, tile=tile)
 
 
 @app.route('/fullscreen_map')
 def fullscreen_map():
-    """Полноэкранная карта"""
-    user_city = get_user_city()
-    tile_provider = request.args.get('tile', 'openstreetmap')
-
-    conn = database.get_db_connection()
-
-    if user_city:
-        zones = conn.execute('''
-            SELECT gz.*, 
-                   COALESCE(AVG(zr.health_score), 0) as avg_health,
-                   COUNT(CASE WHEN mt.status = "pending" THEN 1 END) as pending_tasks
-            FROM green_zones gz
-            LEFT JOIN zone_reports zr ON gz.id = zr.zone_id
-            LEFT JOIN maintenance_tasks mt ON gz.id = mt.zone_id
-            WHERE gz.city_id = (SELECT id FROM cities WHERE name = ?)
-            AND gz.status = 'approved'
-            GROUP BY gz.id
-        ''', (user_city,)).fetchall()
-    else:
-        zones = conn.execute('''
-            SELECT gz.*, 
-                   COALESCE(AVG(zr.health_score), 0) as avg_health,
-                   COUNT(CASE WHEN mt.status = "pending" THEN 1 END) as pending_tasks
-            FROM green_zones gz
-            LEFT JOIN zone_reports zr ON gz.id = zr.zone_id
-            LEFT JOIN maintenance_tasks mt ON gz.id = mt.zone_id
-            WHERE gz.status = 'approved'
-            GROUP BY gz.id
-        ''').fetchall()
-
-    # Преобразуем Row объекты в словари для удобства
-    zones_list = []
-    for zone in zones:
-        zones_list.append({
-            'id': zone['id'],
-            'name': zone['name'],
-            'zone_type': zone['zone_type'],
-            'area': zone['area'],
-            'location': zone['location'],
-            'coordinates': zone['coordinates'],
-            'avg_health': zone['avg_health'],
-            'pending_tasks': zone['pending_tasks']
-        })
+    """Полноэкранная карта
 
-    conn.close()
-
-    # Генерируем полноэкранную карту
-    map_html = maps.MapService.generate_leaflet_map(zones_list, tile_provider=tile_provider)
+    Страница не зависит от данных и пользователя, поэтому кэшируется по провайдеру тайлов.
+    """
+    tile_provider = request.args.get('tile', 'openstreetmap')
 
-    return map_html
+    response = make_response(render_template('fullscreen_map.html', tile=maps.get_tile_layer(tile_provider)))
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600
+    response.add_etag()
+    return response.make_conditional(request)
 
 
 @app.route('/add_zone', methods=['GET', 'POST'])
@@ -299,13 +308,23 @@ def add_zone():
             status = 'pending'
             approved_by = None
 
+        # Числовые координаты разбираем один раз при записи
+        lat, lon = database.parse_coordinates(coordinates) or (None, None)
+
         # Вставляем новую зону
-        conn.execute(
-            'INSERT INTO green_zones (city_id, name, zone_type, area, location, coordinates, created_by, status, approved_by) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
-            (city['id'], name, zone_type, area, location, coordinates, session['user_id'], status, approved_by)
+        cursor = conn.execute(
+            'INSERT INTO green_zones (city_id, name, zone_type, area, location, coordinates, lat, lon, created_by, status, approved_by) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (city['id'], name, zone_type, area, location, coordinates, lat, lon, session['user_id'], status,
+             approved_by)
         )
+        if status == 'approved':
+            database.count_approved_zone(conn, cursor.lastrowid, 1)
+        database.bump_data_version(conn, 'zones')
+        database.bump_city_version(conn, city['id'])
+        database.adjust_user_stats(conn, session['user_id'], zones=1)
         conn.commit()
         conn.close()
+        database.invalidate_moderation_counters()
 
         if user_role in ['admin', 'creator']:
             flash('Зеленая зона успешно создана!', 'success')
@@ -315,7 +334,7 @@ def add_zone():
         return redirect(url_for('map_view'))
 
     # Получаем координаты города для центра карты
-    city_coords = maps.MapService.get_nominatim_coordinates(user_city)
+    city_coords = maps.MapService.get_city_coordinates(user_city)
     default_coords = ""
     if city_coords:
         default_coords = f"{city_coords['lat']:.6f},{city_coords['lon']:.6f}"
@@ -398,6 +417,9 @@ def delete_zone(zone_id):
 
     # Удаляем связанные данные (отчеты и задачи)
     try:
+        # Вычитаем зону, ее отчеты и задачи из счетчиков пользователей
+        database.forget_zone_activity(conn, zone_id)
+
         # Удаляем отчеты о зоне
         conn.execute('DELETE FROM zone_reports WHERE zone_id = ?', (zone_id,))
 
@@ -407,10 +429,16 @@ def delete_zone(zone_id):
         # Удаляем задачи по зоне
         conn.execute('DELETE FROM maintenance_tasks WHERE zone_id = ?', (zone_id,))
 
+        # Удаляем агрегаты зоны
+        database.delete_zone_stats(conn, zone_id)
+
         # Удаляем саму зону
         conn.execute('DELETE FROM green_zones WHERE id = ?', (zone_id,))
+        database.bump_data_version(conn, 'zones')
+        database.bump_city_version(conn, zone['city_id'])
 
         conn.commit()
+        database.invalidate_moderation_counters()
         flash(f'Зеленая зона "{zone["name"]}" успешно удалена', 'success')
 
     except Exception as e:
@@ -565,7 +593,7 @@ def task_verification():
 def add_report():
     """Добавление отчета о состоянии зоны"""
     zone_id = request.form['zone_id']
-    health_score = request.form['health_score']
+    health_score = request.form.get('health_score', type=int)
     needs_watering = 1 if 'needs_watering' in request.form else 0
     needs_pruning = 1 if 'needs_pruning' in request.form else 0
     needs_cleaning = 1 if 'needs_cleaning' in request.form else 0
@@ -581,6 +609,11 @@ def add_report():
         conn.close()
         return redirect(url_for('map_view'))
 
+    if health_score is None or not 0 <= health_score <= 100:
+        flash('Оценка состояния должна быть целым числом от 0 до 100', 'danger')
+        conn.close()
+        return redirect(url_for('zone_detail', zone_id=zone_id))
+
     # Получаем информацию о зоне для city_id
     zone_info = conn.execute('SELECT city_id FROM green_zones WHERE id = ?', (zone_id,)).fetchone()
 
@@ -592,6 +625,9 @@ def add_report():
         zone_id, zone_info['city_id'], health_score, needs_watering, needs_pruning, needs_cleaning, needs_repair, notes,
         session['user_id'])
     )
+    database.record_zone_report(conn, zone_id, health_score)
+    database.adjust_user_stats(conn, session['user_id'], reports=1)
+    database.bump_city_version(conn, zone_info['city_id'])
 
     conn.commit()
     conn.close()
@@ -601,6 +637,7 @@ def add_report():
 
 
 @app.route('/reports')
+@pagecache.cached_response()
 def reports():
     """Страница с аналитикой и отчетами"""
     user_city = get_user_city()
@@ -629,17 +666,16 @@ def reports():
             GROUP BY health_category
         ''', (user_city,)).fetchall()
 
-        # Самые проблемные зоны
+        # Самые проблемные зоны: средняя оценка и число задач берутся из агрегатов zone_stats
         problem_zones = conn.execute('''
-            SELECT gz.name, AVG(zr.health_score) as avg_health, COUNT(mt.id) as pending_tasks
-            FROM green_zones gz
-            LEFT JOIN zone_reports zr ON gz.id = zr.zone_id
-            LEFT JOIN maintenance_tasks mt ON gz.id = mt.zone_id AND mt.status = 'pending'
-            WHERE gz.city_id = (SELECT id FROM cities WHERE name = ?)
+            SELECT gz.name, zs.health_sum * 1.0 / NULLIF(zs.health_count, 0) as avg_health,
+                   zs.pending_tasks
+            FROM zone_stats zs
+            JOIN green_zones gz ON gz.id = zs.zone_id
+            WHERE zs.city_id = (SELECT id FROM cities WHERE name = ?)
             AND gz.status = 'approved'
-            GROUP BY gz.id
-            HAVING avg_health < 60 OR pending_tasks > 0
-            ORDER BY avg_health ASC, pending_tasks DESC
+            AND (avg_health < 60 OR zs.pending_tasks > 0)
+            ORDER BY avg_health ASC, zs.pending_tasks DESC
             LIMIT 5
         ''', (user_city,)).fetchall()
     else:
@@ -663,17 +699,16 @@ def reports():
             GROUP BY health_category
         ''').fetchall()
 
-        # Самые проблемные зоны
+        # Самые проблемные зоны: средняя оценка и число задач берутся из агрегатов zone_stats
         problem_zones = conn.execute('''
-            SELECT gz.name, c.name as city_name, AVG(zr.health_score) as avg_health, COUNT(mt.id) as pending_tasks
-            FROM green_zones gz
+            SELECT gz.name, c.name as city_name,
+                   zs.health_sum * 1.0 / NULLIF(zs.health_count, 0) as avg_health, zs.pending_tasks
+            FROM zone_stats zs
+            JOIN green_zones gz ON gz.id = zs.zone_id
             JOIN cities c ON gz.city_id = c.id
-            LEFT JOIN zone_reports zr ON gz.id = zr.zone_id
-            LEFT JOIN maintenance_tasks mt ON gz.id = mt.zone_id AND mt.status = 'pending'
             WHERE gz.status = 'approved'
-            GROUP BY gz.id
-            HAVING avg_health < 60 OR pending_tasks > 0
-            ORDER BY avg_health ASC, pending_tasks DESC
+            AND (avg_health < 60 OR zs.pending_tasks > 0)
+            ORDER BY avg_health ASC, zs.pending_tasks DESC
             LIMIT 5
         ''').fetchall()
 
@@ -773,60 +808,239 @@ def admin_organizations():
     return render_template('admin_organizations.html', organizations=organizations, cities=cities)
 
 
+@app.route('/admin/profiles')
+@admin_required
+def admin_profiles():
+    """Админ-панель: снимки профилирования запросов"""
+    return render_template('admin_profiles.html', profiles=profiler.list_profiles())
+
+
+@app.route('/admin/profiles/<name>')
+@admin_required
+def admin_profile(name):
+    """Flame graph одного снимка"""
+    profile = profiler.load(name)
+    if profile is None:
+        abort(404)
+    meta, lines = profile
+    return render_template('admin_profile.html', meta=meta, tree=profiler.flame_tree(lines),
+                           min_share=profiler.FLAME_MIN_SHARE)
+
+
+@app.route('/admin/profiles/<name>.collapsed')
+@admin_required
+def admin_profile_collapsed(name):
+    """Снимок в формате collapsed stacks (для flamegraph.pl или speedscope)"""
+    profile = profiler.load(name)
+    if profile is None:
+        abort(404)
+    response = make_response('\n'.join(profile[1]) + '\n')
+    response.mimetype = 'text/plain'
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.collapsed'
+    return response
+
+
+# Поля зоны в ответе /api/zones (их можно ограничить параметром fields)
+ZONE_API_FIELDS = ('id', 'name', 'type', 'area', 'location', 'coordinates', 'lat', 'lon',
+                   'city', 'health_score', 'pending_tasks')
+ZONES_PAGE_MAX = 1000
+
+
+def zone_to_api(zone, fields=ZONE_API_FIELDS):
+    """Представление зоны для API"""
+    values = {
+        'id': zone['id'],
+        'name': zone['name'],
+        'type': zone['zone_type'],
+        'area': zone['area'],
+        'location': zone['location'],
+        'coordinates': zone['coordinates'],
+        'lat': zone['lat'],
+        'lon': zone['lon'],
+        'city': zone['city_name'],
+        'health_score': round(zone['avg_health']),
+        'pending_tasks': zone['pending_tasks']
+    }
+    return {field: values[field] for field in fields}
+
+
+def parse_zone_filters():
+    """Общие параметры списков зон: (bbox, after, limit); ValueError с текстом ошибки"""
+    bbox = None
+    if request.args.get('bbox'):
+        try:
+            bbox = database.parse_bbox(request.args['bbox'])
+        except ValueError:
+            raise ValueError('Некорректный параметр bbox')
+
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', type=int)
+    if after is not None and limit is None:
+        limit = ZONES_PAGE_MAX
+    if limit is not None and not 1 <= limit <= ZONES_PAGE_MAX:
+        raise ValueError(f'limit должен быть от 1 до {ZONES_PAGE_MAX}')
+
+    return bbox, after, limit
+
+
+def parse_field_list(name, allowed, default=None):
+    """Список полей из параметра name (через запятую); ValueError при неизвестном поле"""
+    if not request.args.get(name):
+        return default if default is not None else allowed
+    fields = tuple(request.args[name].split(','))
+    if not set(fields) <= set(allowed):
+        raise ValueError(f'Некорректный параметр {name}')
+    return fields
+
+
 @app.route('/api/zones')
+@pagecache.cached_response(per_user=False)
 def api_zones():
-    """API для получения данных о зонах"""
+    """API для получения данных о зонах
+
+    ?bbox=minLon,minLat,maxLon,maxLat - только зоны в видимой области карты
+    ?after=<id>&limit=<n> - постраничная выборка по id; ссылка на следующую страницу в заголовке Link
+    ?fields=id,name,lat,lon - только перечисленные поля
+    ?format=ndjson|stream - потоковая выдача (NDJSON или JSON-массив по частям) без заголовка Link:
+    следующую страницу запрашивают с after=<id последней зоны>
+    """
     user_city = get_user_city()
-    conn = database.get_db_connection()
 
-    if user_city:
-        zones = conn.execute('''
-            SELECT gz.*, c.name as city_name,
-                   COALESCE(AVG(zr.health_score), 0) as avg_health,
-                   COUNT(CASE WHEN mt.status = "pending" THEN 1 END) as pending_tasks
-            FROM green_zones gz
-            JOIN cities c ON gz.city_id = c.id
-            LEFT JOIN zone_reports zr ON gz.id = zr.zone_id
-            LEFT JOIN maintenance_tasks mt ON gz.id = mt.zone_id
-            WHERE c.name = ?
-            AND gz.status = 'approved'
-            GROUP BY gz.id
-        ''', (user_city,)).fetchall()
-    else:
-        zones = conn.execute('''
-            SELECT gz.*, c.name as city_name,
-                   COALESCE(AVG(zr.health_score), 0) as avg_health,
-                   COUNT(CASE WHEN mt.status = "pending" THEN 1 END) as pending_tasks
-            FROM green_zones gz
-            JOIN cities c ON gz.city_id = c.id
-            LEFT JOIN zone_reports zr ON gz.id = zr.zone_id
-            LEFT JOIN maintenance_tasks mt ON gz.id = mt.zone_id
-            WHERE gz.status = 'approved'
-            GROUP BY gz.id
-        ''').fetchall()
+    try:
+        bbox, after, limit = parse_zone_filters()
+        fields = parse_field_list('fields', ZONE_API_FIELDS)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    output_format = streaming.requested_format()
+    if output_format != 'json':
+        zones = database.iter_approved_zones(user_city, bbox=bbox, after=after, limit=limit)
+        return streaming.json_stream((zone_to_api(zone, fields) for zone in zones),
+                                     ndjson=output_format == 'ndjson')
+
+    # Одна лишняя строка показывает, есть ли следующая страница
+    zones = database.get_approved_zones_for_city(user_city=user_city, bbox=bbox, after=after,
+                                                 limit=limit + 1 if limit else None)
+    next_after = None
+    if limit and len(zones) > limit:
+        zones = zones[:limit]
+        next_after = zones[-1]['id']
+
+    response = jsonify([zone_to_api(zone, fields) for zone in zones])
+    if next_after is not None:
+        args = request.args.to_dict()
+        args.update(after=next_after, limit=limit)
+        response.headers['Link'] = f'<{url_for("api_zones", **args)}>; rel="next"'
+    return response
+
+
+# Свойства Feature в /api/zones.geojson: координаты уже есть в geometry
+GEOJSON_PROPERTIES = tuple(field for field in ZONE_API_FIELDS if field not in ('id', 'lat', 'lon', 'coordinates'))
+
+
+@app.route('/api/zones.geojson')
+def api_zones_geojson():
+    """Одобренные зоны как GeoJSON FeatureCollection для ГИС
+
+    Фильтры те же, что у /api/zones (город из сессии, bbox, after/limit), а также
+    ?precision=<0..7> - знаков после запятой в координатах (по умолчанию 5, около 1 м)
+    ?properties=name,type - только перечисленные свойства
+    """
+    user_city = get_user_city()
 
-    zones_list = []
-    for zone in zones:
-        zones_list.append({
-            'id': zone['id'],
-            'name': zone['name'],
-            'type': zone['zone_type'],
-            'area': zone['area'],
-            'location': zone['location'],
-            'coordinates': zone['coordinates'],
-            'city': zone['city_name'],
-            'health_score': round(zone['avg_health']),
-            'pending_tasks': zone['pending_tasks']
-        })
+    try:
+        bbox, after, limit = parse_zone_filters()
+        properties = parse_field_list('properties', GEOJSON_PROPERTIES)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    precision = request.args.get('precision', geojson.DEFAULT_PRECISION, type=int)
+    if not 0 <= precision <= geojson.MAX_PRECISION:
+        return jsonify({'success': False,
+                        'message': f'precision должен быть от 0 до {geojson.MAX_PRECISION}'}), 400
+
+    def build():
+        zones = database.get_approved_zones_for_city(user_city=user_city, bbox=bbox, after=after, limit=limit)
+        fields = ('id', 'lat', 'lon') + properties
+        collection = geojson.feature_collection((zone_to_api(zone, fields) for zone in zones),
+                                                precision, properties)
+        return app.response_class(geojson.dumps(collection), mimetype=geojson.MIMETYPE)
+
+    response = versioned_json(database.get_city_data_version(user_city), build,
+                              variant='gzip' if accepts_gzip() else '')
+    return gzip_response(response)
+
+
+@app.route('/api/zones.bin')
+def api_zones_bin():
+    """Одобренные зоны в компактном бинарном формате (см. zonebin.py)
+
+    Фильтры те же, что у /api/zones: город из сессии, bbox, after/limit.
+    """
+    user_city = get_user_city()
 
-    conn.close()
-    return jsonify(zones_list)
+    try:
+        bbox, after, limit = parse_zone_filters()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    def build():
+        zones = database.get_approved_zones_for_city(user_city=user_city, bbox=bbox, after=after, limit=limit)
+        return app.response_class(zonebin.encode(zones), mimetype=zonebin.MIMETYPE)
+
+    response = versioned_json(database.get_city_data_version(user_city), build,
+                              variant='gzip' if accepts_gzip() else '')
+    return gzip_response(response)
+
+
+@app.route('/api/zones/clusters')
+def api_zone_clusters():
+    """API кластеров зон для уровня масштаба карты
+
+    ?z=<0..18>&bbox=minLon,minLat,maxLon,maxLat
+    """
+    user_city = get_user_city()
+
+    zoom = request.args.get('z', type=int)
+    if zoom is None or not 0 <= zoom <= clusters.MAX_ZOOM:
+        return jsonify({'success': False, 'message': 'Некорректный параметр z'}), 400
+
+    bbox = None
+    if request.args.get('bbox'):
+        try:
+            bbox = database.parse_bbox(request.args['bbox'])
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Некорректный параметр bbox'}), 400
+
+    return versioned_json(database.get_city_data_version(user_city), lambda: {
+        'zoom': zoom,
+        'clusters': clusters.get_clusters(zoom, bbox=bbox, city=user_city)
+    })
+
+
+@app.route('/api/map_data')
+def api_map_data():
+    """API начального состояния карты: число зон и их границы"""
+    user_city = get_user_city()
+
+    def build():
+        extent = database.get_zone_extent(user_city)
+        if extent['count']:
+            bounds = [extent['min_lon'], extent['min_lat'], extent['max_lon'], extent['max_lat']]
+        else:
+            # Зон с координатами нет - показываем город пользователя по справочнику
+            bounds = maps.MapService.get_default_bounds(user_city)
+        return {'count': extent['count'], 'bounds': bounds}
+
+    # Границы по умолчанию берутся из справочника городов, поэтому в версии есть и 'cities'
+    version = f"{database.get_city_data_version(user_city)}:{database.get_data_version('cities')}"
+    return versioned_json(version, build)
 
 
 @app.route('/api/city_coordinates/<city_name>')
 def api_city_coordinates(city_name):
-    """API для получения координат города"""
-    coordinates = maps.MapService.get_nominatim_coordinates(city_name)
+    """API для получения координат города (из справочника cities)"""
+    coordinates = maps.MapService.get_city_coordinates(city_name)
     if coordinates:
         return jsonify({
             'success': True,
@@ -841,15 +1055,68 @@ def api_city_coordinates(city_name):
 
 @app.route('/api/city_suggestions')
 def api_city_suggestions():
-    """API для автозаполнения городов"""
+    """API для автозаполнения городов
+
+    ?q=<начало названия или региона>&limit=<1..100>
+    """
     query = request.args.get('q', '')
+    limit = request.args.get('limit', citysearch.DEFAULT_LIMIT, type=int)
+    if not 1 <= limit <= citysearch.MAX_LIMIT:
+        return jsonify({'success': False,
+                        'message': f'limit должен быть от 1 до {citysearch.MAX_LIMIT}'}), 400
     if len(query) < 2:
         return jsonify([])
 
-    suggestions = maps.MapService.get_city_suggestions(query)
+    suggestions = maps.MapService.get_city_suggestions(query, limit)
     return jsonify(suggestions)
 
 
+@app.route('/api/search')
+def api_search():
+    """API полнотекстового поиска по зонам, заметкам отчетов и организациям
+
+    ?q=<запрос>&city=<город>&type=zone,report,organization&page=1&per_page=20
+    """
+    query = request.args.get('q', '').strip()
+    if not fulltext.build_match_query(query):
+        return jsonify({'success': False, 'message': 'Пустой поисковый запрос'}), 400
+
+    city_id = None
+    city_name = request.args.get('city', get_user_city())
+    if city_name:
+        city = database.get_city(city_name)
+        if city is None:
+            return jsonify({'success': False, 'message': 'Город не найден'}), 404
+        city_id = city['id']
+
+    types = fulltext.SEARCH_TYPES
+    if request.args.get('type'):
+        types = [kind for kind in request.args['type'].split(',') if kind in fulltext.SEARCH_TYPES]
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', fulltext.SEARCH_PAGE_SIZE, type=int), 1),
+                   fulltext.MAX_SEARCH_PAGE_SIZE)
+
+    hits, has_more = fulltext.search(query, city_id=city_id, types=types,
+                                     limit=per_page, offset=(page - 1) * per_page)
+
+    return jsonify({
+        'success': True,
+        'page': page,
+        'per_page': per_page,
+        'has_more': has_more,
+        'results': [{
+            'type': hit['type'],
+            'id': hit['id'],
+            'zone_id': hit['zone_id'],
+            'title': hit['title'],
+            'snippet': hit['snippet'],
+            'city': hit['city_name'],
+            'url': url_for('zone_detail', zone_id=hit['zone_id']) if hit['zone_id'] else None
+        } for hit in hits]
+    })
+
+
 @app.route('/api/geocode')
 def api_geocode():
     """API для геокодирования адреса"""
@@ -893,6 +1160,8 @@ def api_reverse_geocode():
                 'success': False,
                 'message': 'Адрес не найден'
             }), 404
+    except ratelimit.RateLimited:
+        raise
     except Exception as e:
         return jsonify({
             'success': False,
@@ -921,28 +1190,23 @@ def internal_error(error):
 
 @app.context_processor
 def inject_moderation_link():
+    def is_admin():
+        return session.get('role') in ['admin', 'creator']
+
     def has_pending_zones():
-        if session.get('role') in ['admin', 'creator']:
-            pending_zones = database.get_pending_zones()
-            return len(pending_zones) > 0
-        return False
+        return get_pending_zones_count() > 0
 
     def get_pending_zones_count():
-        if session.get('role') in ['admin', 'creator']:
-            pending_zones = database.get_pending_zones()
-            return len(pending_zones)
+        if is_admin():
+            return database.get_moderation_counters()['pending_zones']
         return 0
 
     def has_tasks_awaiting_verification():
-        if session.get('role') in ['admin', 'creator']:
-            tasks = database.get_tasks_awaiting_verification()
-            return len(tasks) > 0
-        return False
+        return get_tasks_awaiting_verification_count() > 0
 
     def get_tasks_awaiting_verification_count():
-        if session.get('role') in ['admin', 'creator']:
-            tasks = database.get_tasks_awaiting_verification()
-            return len(tasks)
+        if is_admin():
+            return database.get_moderation_counters()['tasks_awaiting_verification']
         return 0
 
     return dict(
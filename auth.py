@@ -1,5 +1,8 @@
 from flask import render_template, request, redirect, url_for, flash, session, jsonify
+import citysearch
 import database
+import gazetteer
+import streaming
 
 
 def init_auth_routes(app):
@@ -119,15 +122,7 @@ def init_auth_routes(app):
         user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
 
         # Статистика пользователя
-        user_stats = {
-            'zones_added':
-                conn.execute('SELECT COUNT(*) FROM green_zones WHERE created_by = ?', (session['user_id'],)).fetchone()[
-                    0],
-            'reports_submitted': conn.execute('SELECT COUNT(*) FROM zone_reports WHERE reporter_id = ?',
-                                              (session['user_id'],)).fetchone()[0],
-            'tasks_created': conn.execute('SELECT COUNT(*) FROM maintenance_tasks WHERE created_by = ?',
-                                          (session['user_id'],)).fetchone()[0]
-        }
+        user_stats = database.get_user_stats(session['user_id'])
 
         cities_by_region = database.get_cities_by_region()
         conn.close()
@@ -192,14 +187,7 @@ def init_auth_routes(app):
             return redirect(url_for('index'))
 
         # Статистика пользователя
-        user_stats = {
-            'zones_added': conn.execute('SELECT COUNT(*) FROM green_zones WHERE created_by = ?', (user_id,)).fetchone()[
-                0],
-            'reports_submitted':
-                conn.execute('SELECT COUNT(*) FROM zone_reports WHERE reporter_id = ?', (user_id,)).fetchone()[0],
-            'tasks_created':
-                conn.execute('SELECT COUNT(*) FROM maintenance_tasks WHERE created_by = ?', (user_id,)).fetchone()[0]
-        }
+        user_stats = database.get_user_stats(user_id)
 
         cities_by_region = database.get_cities_by_region()
         conn.close()
@@ -236,32 +224,31 @@ def init_auth_routes(app):
     @admin_required
     def search_cities():
         """Поиск городов (API endpoint)"""
-        query = request.args.get('q', '').lower().strip()
+        query = request.args.get('q', '').strip()
+        limit = request.args.get('limit', 50, type=int)
+        if not 1 <= limit <= citysearch.MAX_LIMIT:
+            return jsonify({'success': False,
+                            'message': f'limit должен быть от 1 до {citysearch.MAX_LIMIT}'}), 400
 
-        conn = database.get_db_connection()
+        # Поиск по префиксу названия или региона в индексе справочника, без запроса к БД
         if query:
-            cities = conn.execute('''
-                    SELECT * FROM cities 
-                    WHERE LOWER(name) LIKE ? OR LOWER(region) LIKE ?
-                    ORDER BY name
-                ''', (f'%{query}%', f'%{query}%')).fetchall()
+            cities = citysearch.search(query, limit)
         else:
-            cities = conn.execute('SELECT * FROM cities ORDER BY name').fetchall()
-
-        conn.close()
+            cities = sorted(database.get_all_cities(), key=lambda city: city['name'])
 
         # Преобразуем в JSON-совместимый формат
-        cities_list = []
-        for city in cities:
-            cities_list.append({
-                'id': city['id'],
-                'name': city['name'],
-                'region': city['region'],
-                'population': city['population'],
-                'created_date': city['created_date']
-            })
-
-        return jsonify(cities_list)
+        cities_list = ({
+            'id': city['id'],
+            'name': city['name'],
+            'region': city['region'],
+            'population': city['population'],
+            'created_date': city['created_date']
+        } for city in cities)
+
+        output_format = streaming.requested_format()
+        if output_format != 'json':
+            return streaming.json_stream(cities_list, ndjson=output_format == 'ndjson')
+        return jsonify(list(cities_list))
 
     @app.route('/admin/cities/add', methods=['POST'])
     @admin_required
@@ -289,12 +276,22 @@ def init_auth_routes(app):
         # Добавляем город
         try:
             population_int = int(population) if population else None
-            conn.execute(
+            # Координаты получаем до записи: кэш геокодирования и лимит запросов пишут в БД
+            # через другие соединения и не должны ждать транзакцию этого запроса
+            location = gazetteer.locate_city(name, region, population_int)
+            cursor = conn.execute(
                 'INSERT INTO cities (name, region, population) VALUES (?, ?, ?)',
                 (name, region, population_int)
             )
+            if location:
+                gazetteer.set_city_coordinates(conn, cursor.lastrowid, *location)
+            database.invalidate_reference_data(conn)
             conn.commit()
-            flash(f'Город "{name}" успешно добавлен', 'success')
+            if location:
+                flash(f'Город "{name}" успешно добавлен', 'success')
+            else:
+                flash(f'Город "{name}" добавлен, но координаты не найдены: '
+                      f'их дозаполнит python gazetteer.py fetch', 'warning')
         except Exception as e:
             flash('Ошибка при добавлении города', 'danger')
             print(f"Error adding city: {e}")
@@ -334,6 +331,9 @@ def init_auth_routes(app):
         try:
             # Удаляем город
             conn.execute('DELETE FROM cities WHERE id = ?', (city_id,))
+            database.invalidate_reference_data(conn)
+            database.delete_city_stats(conn, city_id)
+            database.bump_city_version(conn, city_id)
             conn.commit()
             flash(f'Город "{city["name"]}" успешно удален', 'success')
         except Exception as e:
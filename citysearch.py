@@ -0,0 +1,103 @@
+import bisect
+import heapq
+import re
+import threading
+
+import database
+
+# Сколько подсказок отдавать по умолчанию и сколько можно запросить
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+
+# Для коротких префиксов (под них попадает большая часть справочника) лучшие
+# CACHED_LIMIT городов считаются заранее, при построении индекса
+SHORT_PREFIX_LENGTH = 3
+CACHED_LIMIT = 50
+
+_WORD_SEPARATORS = re.compile(r'[\s\-.,()]+')
+
+
+def normalize(text):
+    """Ключ для поиска: регистр и ё/е не важны, пробелы схлопнуты"""
+    return ' '.join(str(text or '').casefold().replace('ё', 'е').split())
+
+
+def _keys(city):
+    """Ключи, по префиксу которых находится город: название, регион и их отдельные слова"""
+    keys = set()
+    for text in (city['name'], city['region']):
+        text = normalize(text)
+        if not text:
+            continue
+        keys.add(text)
+        keys.update(word for word in _WORD_SEPARATORS.split(text) if word)
+    return keys
+
+
+class CityIndex:
+    """Префиксный индекс городов на отсортированном массиве ключей"""
+
+    def __init__(self, cities):
+        self.cities = list(cities)
+        self._names = [normalize(city['name']) for city in self.cities]
+        entries = sorted(
+            (key, position)
+            for position, city in enumerate(self.cities)
+            for key in _keys(city)
+        )
+        self._keys = [key for key, _ in entries]
+        self._positions = [position for _, position in entries]
+
+        short_prefixes = {key[:length] for key in self._keys for length in range(1, SHORT_PREFIX_LENGTH + 1)}
+        self._top = {prefix: self._scan(prefix, CACHED_LIMIT) for prefix in short_prefixes}
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Города, у которых название, регион или слово в них начинается с query; крупные первыми.
+
+        limit - от 1 до MAX_LIMIT, иначе ValueError.
+        """
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ValueError(f'limit должен быть от 1 до {MAX_LIMIT}')
+        prefix = normalize(query)
+        if not prefix:
+            return []
+
+        if len(prefix) <= SHORT_PREFIX_LENGTH and limit <= CACHED_LIMIT:
+            best = self._top.get(prefix, [])[:limit]
+        else:
+            best = self._scan(prefix, limit)
+        return [self.cities[position] for position in best]
+
+    def _scan(self, prefix, limit):
+        """Позиции лучших городов для префикса, найденные по диапазону отсортированных ключей"""
+        start = bisect.bisect_left(self._keys, prefix)
+        # '\uffff' больше любого символа в ключах, поэтому end - граница всех ключей с этим префиксом
+        end = bisect.bisect_left(self._keys, prefix + '\uffff', start)
+        positions = set(self._positions[start:end])
+
+        # Совпадение с началом названия важнее совпадения по региону или второму слову
+        def rank(position):
+            return (self._names[position].startswith(prefix), self.cities[position]['population'] or 0)
+
+        return heapq.nlargest(limit, positions, key=rank)
+
+
+# (версия 'cities', индекс) - заменяются целиком, чтобы версия и индекс не разошлись
+_index = {'current': (None, None)}
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Индекс по справочнику городов; перестраивается, когда меняется версия 'cities'"""
+    version = database.get_cities_version()
+    cached_version, index = _index['current']
+    if index is None or cached_version != version:
+        index = CityIndex(database.get_all_cities())
+        with _index_lock:
+            _index['current'] = (version, index)
+    return index
+
+
+def search(query, limit=DEFAULT_LIMIT):
+    """Подсказки городов по началу названия или региона"""
+    return get_index().search(query, limit)
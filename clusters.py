@@ -0,0 +1,172 @@
+import math
+import time
+
+import database
+import metrics
+from geocache import LRUCache
+
+# Размер ячейки сетки кластеризации в экранных пикселях
+CLUSTER_CELL_SIZE = 64
+MAX_ZOOM = 18
+# Кластеры считаются и кэшируются по плиткам в CLUSTER_TILE_SIZE пикселей: границы плиток
+# совпадают с границами ячеек, поэтому кластер всегда целиком лежит в одной плитке
+CLUSTER_TILE_SIZE = 512
+# Запрос, задевающий больше плиток (огромный bbox на крупном масштабе), считается без кэша
+CLUSTER_MAX_TILES = 64
+CLUSTER_CACHE_ENTRIES = 4096
+# Кэш плиток сбрасывается через версию данных города (зоны, отчеты, задачи);
+# срок жизни только ограничивает хранение давно не запрашиваемых плиток
+CLUSTER_CACHE_TTL = 300
+
+# Ключ - (город, zoom, x плитки, y плитки), значение - (версия данных города, кластеры плитки)
+_cache = LRUCache(CLUSTER_CACHE_ENTRIES)
+
+
+def project(lat, lon):
+    """Web Mercator: координаты точки в долях мира от 0 до 1"""
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    sin_lat = math.sin(math.radians(lat))
+    x = (lon + 180.0) / 360.0
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return x, y
+
+
+def unproject(x, y):
+    """Обратная проекция: (lat, lon) точки с координатами в долях мира"""
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return lat, x * 360.0 - 180.0
+
+
+def cells_per_world(zoom):
+    return (256 << zoom) // CLUSTER_CELL_SIZE
+
+
+def cell_of(lat, lon, zoom):
+    """Ячейка сетки (x, y), в которую попадает точка на уровне zoom"""
+    cells = cells_per_world(zoom)
+    x, y = project(lat, lon)
+    return min(int(x * cells), cells - 1), min(int(y * cells), cells - 1)
+
+
+def build_clusters(zones, zoom):
+    """Сгруппировать зоны по ячейкам сетки размером CLUSTER_CELL_SIZE пикселей на уровне zoom"""
+    cells = {}
+
+    for zone in zones:
+        lat, lon = zone['lat'], zone['lon']
+        key = cell_of(lat, lon, zoom)
+
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = {
+                'count': 0, 'lat_sum': 0.0, 'lon_sum': 0.0, 'health_sum': 0.0, 'health_zones': 0,
+                'min_lat': lat, 'max_lat': lat, 'min_lon': lon, 'max_lon': lon,
+                'zone': zone
+            }
+        cell['count'] += 1
+        cell['lat_sum'] += lat
+        cell['lon_sum'] += lon
+        # Зоны без отчетов не тянут среднее вниз: их оценка неизвестна, а не нулевая
+        if zone['health_count']:
+            cell['health_sum'] += zone['avg_health']
+            cell['health_zones'] += 1
+        cell['min_lat'] = min(cell['min_lat'], lat)
+        cell['max_lat'] = max(cell['max_lat'], lat)
+        cell['min_lon'] = min(cell['min_lon'], lon)
+        cell['max_lon'] = max(cell['max_lon'], lon)
+
+    clusters = []
+    for cell in cells.values():
+        count = cell['count']
+        cluster = {
+            'lat': cell['lat_sum'] / count,
+            'lon': cell['lon_sum'] / count,
+            'count': count,
+            'avg_health': round(cell['health_sum'] / cell['health_zones'], 1) if cell['health_zones'] else None,
+            'bounds': [cell['min_lon'], cell['min_lat'], cell['max_lon'], cell['max_lat']]
+        }
+        if count == 1:
+            # Одиночная зона рисуется обычным маркером с карточкой
+            zone = cell['zone']
+            cluster['zone'] = {
+                'id': zone['id'],
+                'name': zone['name'],
+                'zone_type': zone['zone_type'],
+                'area': zone['area'],
+                'location': zone['location'],
+                'pending_tasks': zone['pending_tasks']
+            }
+        clusters.append(cluster)
+
+    return clusters
+
+
+def _cells_clusters(zoom, city, x0, y0, x1, y1):
+    """Кластеры ячеек с x0..x1, y0..y1 включительно; зоны выбираются через zone_rtree"""
+    cells = cells_per_world(zoom)
+    max_lat, min_lon = unproject(x0 / cells, y0 / cells)
+    min_lat, max_lon = unproject((x1 + 1) / cells, (y1 + 1) / cells)
+    # Крайние ячейки включают все, что проекция прижимает к краю мира; небольшой запас
+    # покрывает округление, а лишние зоны отсекает проверка ячейки ниже
+    bbox = (-180.0 if x0 == 0 else min_lon - 1e-9, -90.0 if y1 == cells - 1 else min_lat - 1e-9,
+            180.0 if x1 == cells - 1 else max_lon + 1e-9, 90.0 if y0 == 0 else max_lat + 1e-9)
+
+    zones = []
+    for zone in database.get_approved_zones_for_city(user_city=city, bbox=bbox):
+        x, y = cell_of(zone['lat'], zone['lon'], zoom)
+        if x0 <= x <= x1 and y0 <= y <= y1:
+            zones.append(zone)
+    return build_clusters(zones, zoom)
+
+
+def _tile_clusters(zoom, city, tile_x, tile_y, version):
+    key = (city, zoom, tile_x, tile_y)
+    hit, entry = _cache.get(key)
+    hit = hit and entry[0] == version
+    metrics.record_cache('clusters', hit)
+    if hit:
+        return entry[1]
+
+    cells = cells_per_world(zoom)
+    size = CLUSTER_TILE_SIZE // CLUSTER_CELL_SIZE
+    clusters = _cells_clusters(zoom, city, tile_x * size, tile_y * size,
+                               min((tile_x + 1) * size, cells) - 1, min((tile_y + 1) * size, cells) - 1)
+    _cache.set(key, (version, clusters), time.time() + CLUSTER_CACHE_TTL)
+    return clusters
+
+
+def get_clusters(zoom, bbox=None, city=None):
+    """Кластеры одобренных зон для уровня zoom (города city или всех), пересекающие bbox
+
+    Считаются только плитки, которые задевает bbox, а не весь город целиком.
+    """
+    # Та же версия, что и в ETag ответа /api/zones/clusters: новый ETag - свежие кластеры
+    version = database.get_city_data_version(city)
+    cells = cells_per_world(zoom)
+    if bbox:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        x0, y0 = cell_of(max_lat, min_lon, zoom)
+        x1, y1 = cell_of(min_lat, max_lon, zoom)
+    else:
+        x0, y0, x1, y1 = 0, 0, cells - 1, cells - 1
+
+    size = CLUSTER_TILE_SIZE // CLUSTER_CELL_SIZE
+    tiles_x = range(x0 // size, x1 // size + 1)
+    tiles_y = range(y0 // size, y1 // size + 1)
+    if len(tiles_x) * len(tiles_y) <= CLUSTER_MAX_TILES:
+        clusters = []
+        for tile_x in tiles_x:
+            for tile_y in tiles_y:
+                clusters.extend(_tile_clusters(zoom, city, tile_x, tile_y, version))
+    else:
+        clusters = _cells_clusters(zoom, city, x0, y0, x1, y1)
+
+    if bbox:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        clusters = [
+            cluster for cluster in clusters
+            if cluster['bounds'][2] >= min_lon and cluster['bounds'][0] <= max_lon
+            and cluster['bounds'][3] >= min_lat and cluster['bounds'][1] <= max_lat
+        ]
+
+    return clusters
@@ -1,7 +1,27 @@
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timezone
 import hashlib
 import os
+import threading
+import time
+
+from flask import g, has_app_context
+
+# Настройки SQLite, применяемые один раз к каждому новому соединению пула
+DB_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('busy_timeout', 5000),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -32000),  # ~32 МБ страничного кэша
+    ('temp_store', 'MEMORY'),
+)
+
+# Максимум простаивающих соединений в пуле одного воркера
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+
+# Сколько секунд счетчики модерации переиспользуются между запросами
+MODERATION_COUNTERS_TTL = 30
 
 
 def get_db_path():
@@ -12,8 +32,8 @@ def get_db_path():
     return 'green_city.db'
 
 
-def init_db():
-    conn = sqlite3.connect(get_db_path())
+def init_db(db_path=None):
+    conn = sqlite3.connect(db_path or get_db_path())
     c = conn.cursor()
 
     # Таблица пользователей
@@ -156,7 +176,7 @@ def init_db():
 
     conn.commit()
     conn.close()
-    print(f"✅ База данных создана по пути: {get_db_path()}")
+    print(f"✅ База данных создана по пути: {db_path or get_db_path()}")
 
 
 def add_sample_data(cursor):
@@ -321,44 +341,355 @@ def verify_password(password, password_hash):
     return hash_password(password) == password_hash
 
 
+# Обработчики, которые вызываются после каждого запроса через соединения пула:
+# listener(sql, parameters, seconds). Их подключают модули наблюдения (metrics)
+_query_listeners = []
+
+
+def add_query_listener(listener):
+    """Подписаться на выполненные SQL-запросы соединений пула"""
+    if listener not in _query_listeners:
+        _query_listeners.append(listener)
+
+
+def _notify_query(sql, parameters, seconds):
+    for listener in _query_listeners:
+        listener(sql, parameters, seconds)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Курсор, замеряющий время запроса вместе с чтением строк.
+
+    SQLite выполняет SELECT лениво: основная часть работы большого просмотра
+    приходится на fetch*() и итерацию, поэтому их время прибавляется к запросу.
+    Слушатели получают запрос, когда строки дочитаны, курсор выполняет следующий
+    запрос или закрывается (в том числе когда временный курсор удаляется).
+    """
+
+    _timed_sql = None
+    _timed_parameters = None
+    _timed_seconds = 0.0
+
+    def _begin(self, sql, parameters):
+        self._finish()
+        self._timed_sql = sql
+        self._timed_parameters = parameters
+        self._timed_seconds = 0.0
+
+    def _finish(self):
+        sql = self._timed_sql
+        if sql is None:
+            return
+        self._timed_sql = None
+        if _query_listeners:
+            _notify_query(sql, self._timed_parameters, self._timed_seconds)
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._timed_seconds += time.perf_counter() - started
+
+    def _run(self, method, sql, parameters, timed_parameters):
+        self._begin(sql, timed_parameters)
+        try:
+            result = self._timed(method, sql, parameters)
+        except Exception:
+            self._finish()
+            raise
+        # Запрос без строк результата (INSERT, UPDATE, DDL) уже выполнен целиком
+        if self.description is None:
+            self._finish()
+        return result
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters, None)
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        try:
+            return self._timed(super().fetchall)
+        finally:
+            self._finish()
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class PooledConnection(sqlite3.Connection):
+    """Соединение из пула: close() возвращает его в пул вместо закрытия"""
+
+    pool = None
+    request_bound = False
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self.request_bound:
+            # Соединение запроса освобождается в teardown_appcontext
+            return
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+    def dispose(self):
+        """Действительно закрыть соединение"""
+        self.pool = None
+        sqlite3.Connection.close(self)
+
+
+class ConnectionPool:
+    """Пул соединений SQLite в пределах одного процесса (воркера gunicorn)"""
+
+    def __init__(self, db_path, size=DB_POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self.pid = os.getpid()
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in DB_PRAGMAS:
+            conn.execute(f'PRAGMA {name} = {value}')
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        """Взять свободное соединение из пула или открыть новое"""
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+        return conn
+
+    def release(self, conn):
+        """Вернуть соединение в пул, откатив незавершенную транзакцию"""
+        conn.request_bound = False
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.dispose()
+
+    def close_all(self):
+        """Закрыть все простаивающие соединения"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.dispose()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Пул текущего процесса; после fork или смены пути к БД создается заново"""
+    global _pool
+    db_path = get_db_path()
+    pool = _pool
+    if pool is None or pool.pid != os.getpid() or pool.db_path != db_path:
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid() or _pool.db_path != db_path:
+                # Соединения, унаследованные от родительского процесса, не трогаем
+                _pool = ConnectionPool(db_path)
+            pool = _pool
+    return pool
+
+
 def get_db_connection():
-    conn = sqlite3.connect(get_db_path())
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Получить соединение с БД.
+
+    Внутри запроса Flask все вызовы получают одно соединение, привязанное к g,
+    вне запроса - соединение из пула. close() в обоих случаях ничего не закрывает.
+    """
+    if has_app_context():
+        conn = g.get('_db_conn')
+        if conn is None:
+            conn = get_pool().acquire()
+            conn.request_bound = True
+            g._db_conn = conn
+        return conn
+    return get_pool().acquire()
+
+
+def close_request_connection(exc=None):
+    """Вернуть соединение запроса в пул"""
+    conn = g.pop('_db_conn', None)
+    if conn is not None:
+        conn.request_bound = False
+        conn.close()
+
+
+def init_app(app):
+    """Подключить управление соединениями к приложению Flask"""
+    app.teardown_appcontext(close_request_connection)
+
+
+def get_data_version(scope, conn=None):
+    """Текущая версия данных области (например, 'cities'), общая для всех воркеров"""
+    own_connection = conn is None
+    if own_connection:
+        conn = get_db_connection()
+    row = conn.execute('SELECT version FROM data_versions WHERE scope = ?', (scope,)).fetchone()
+    if own_connection:
+        conn.close()
+    return row[0] if row else 0
+
+
+def bump_data_version(conn, scope):
+    """Увеличить версию данных области в текущей транзакции"""
+    conn.execute('''
+        INSERT INTO data_versions (scope, version) VALUES (?, 1)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1, updated_date = CURRENT_TIMESTAMP
+    ''', (scope,))
+
+
+def bump_city_version(conn, city_id):
+    """Отметить изменение зон, отчетов, задач или организаций города (вызывать перед commit)"""
+    bump_data_version(conn, f'city:{city_id}')
+    bump_data_version(conn, 'city:all')
+
+
+def bump_zone_city_version(conn, zone_id):
+    """То же, что bump_city_version, для города зоны zone_id"""
+    zone = conn.execute('SELECT city_id FROM green_zones WHERE id = ?', (zone_id,)).fetchone()
+    if zone:
+        bump_city_version(conn, zone['city_id'])
+
+
+def get_city_data_version(city_name=None):
+    """Версия данных о зонах города (без города - всех городов)"""
+    return get_city_data_stamp(city_name)[0]
+
+
+def get_city_data_stamp(city_name=None):
+    """(версия, время изменения в UTC или None) данных о зонах города или всех городов"""
+    if not city_name:
+        scope = 'city:all'
+    else:
+        city = get_city(city_name)
+        if city is None:
+            return 0, None
+        scope = f'city:{city["id"]}'
 
-def get_cities():
-    """Получить список всех городов"""
     conn = get_db_connection()
-    cities = conn.execute('SELECT * FROM cities ORDER BY region, name').fetchall()
+    row = conn.execute('SELECT version, updated_date FROM data_versions WHERE scope = ?', (scope,)).fetchone()
     conn.close()
-    return cities
+    if row is None:
+        return 0, None
+    updated = datetime.strptime(row['updated_date'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return row['version'], updated
 
 
-def get_all_cities():
-    """Получить список всех городов"""
+# Справочник городов меняется только через админку, поэтому держим его в памяти воркера
+# и перечитываем, когда версия 'cities' в БД отличается от закэшированной
+_reference_cache = {'version': None, 'cities': None, 'cities_by_region': None, 'cities_by_name': None}
+_reference_lock = threading.Lock()
+
+
+def _get_reference_data():
+    """Справочник городов из кэша; версия в БД проверяется не чаще раза за запрос"""
+    if has_app_context() and '_reference_data' in g:
+        return g._reference_data
+
     conn = get_db_connection()
-    cities = conn.execute('''
-        SELECT * FROM cities 
-        ORDER BY region, name
-    ''').fetchall()
+    version = get_data_version('cities', conn)
+    if _reference_cache['version'] != version:
+        cities = conn.execute('SELECT * FROM cities ORDER BY region, name').fetchall()
+
+        cities_by_region = {}
+        for city in cities:
+            region = city['region']
+            if region not in cities_by_region:
+                cities_by_region[region] = []
+            cities_by_region[region].append(city)
+
+        cities_by_name = {city['name']: city for city in cities}
+
+        with _reference_lock:
+            _reference_cache.update(version=version, cities=cities, cities_by_region=cities_by_region,
+                                    cities_by_name=cities_by_name)
     conn.close()
-    return cities
+
+    data = dict(_reference_cache)
+    if has_app_context():
+        g._reference_data = data
+    return data
+
+
+def invalidate_reference_data(conn):
+    """Отметить изменение справочника городов (вызывать перед commit)"""
+    bump_data_version(conn, 'cities')
+    _reference_cache['version'] = None
+    if has_app_context():
+        g.pop('_reference_data', None)
+
+
+def get_cities():
+    """Получить список всех городов"""
+    return _get_reference_data()['cities']
+
+
+def get_all_cities():
+    """Получить список всех городов"""
+    return _get_reference_data()['cities']
 
 
 def get_cities_by_region():
     """Получить города сгруппированные по регионам"""
-    conn = get_db_connection()
-    cities = conn.execute('SELECT * FROM cities ORDER BY region, name').fetchall()
-    conn.close()
+    return _get_reference_data()['cities_by_region']
+
 
-    cities_by_region = {}
-    for city in cities:
-        region = city['region']
-        if region not in cities_by_region:
-            cities_by_region[region] = []
-        cities_by_region[region].append(city)
+def get_cities_version():
+    """Версия справочника городов, по которой построены закэшированные данные"""
+    return _get_reference_data()['version']
 
-    return cities_by_region
+
+def get_city(name):
+    """Город по названию (с центром и границами) или None"""
+    if not name:
+        return None
+    return _get_reference_data()['cities_by_name'].get(name)
 
 
 def get_all_users():
@@ -416,15 +747,13 @@ def toggle_user_status(user_id):
 
 def get_user_actions(user_id):
     """Получить действия пользователя (зоны, отчеты, задачи)"""
+    stats = get_user_stats(user_id)
     conn = get_db_connection()
 
     actions = {
-        'zones_created': conn.execute('SELECT COUNT(*) FROM green_zones WHERE created_by = ?', (user_id,)).fetchone()[
-            0],
-        'reports_submitted':
-            conn.execute('SELECT COUNT(*) FROM zone_reports WHERE reporter_id = ?', (user_id,)).fetchone()[0],
-        'tasks_created':
-            conn.execute('SELECT COUNT(*) FROM maintenance_tasks WHERE created_by = ?', (user_id,)).fetchone()[0],
+        'zones_created': stats['zones_added'],
+        'reports_submitted': stats['reports_submitted'],
+        'tasks_created': stats['tasks_created'],
         'recent_zones': conn.execute('''
             SELECT name, created_date FROM green_zones 
             WHERE created_by = ? 
@@ -458,72 +787,486 @@ def get_pending_zones():
     return zones
 
 
+_moderation_counters = {'value': None, 'expires': 0}
+
+
+def get_moderation_counters():
+    """Количество зон на модерации и задач, ожидающих подтверждения.
+
+    В пределах запроса значение вычисляется один раз, между запросами
+    кэшируется на MODERATION_COUNTERS_TTL секунд.
+    """
+    if has_app_context() and '_moderation_counters' in g:
+        return g._moderation_counters
+
+    counters = _moderation_counters['value']
+    if counters is None or time.monotonic() >= _moderation_counters['expires']:
+        conn = get_db_connection()
+        row = conn.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM green_zones WHERE status = 'pending') as pending_zones,
+                (SELECT COUNT(*) FROM maintenance_tasks WHERE status = 'verification_requested')
+                    as tasks_awaiting_verification
+        ''').fetchone()
+        conn.close()
+
+        counters = {
+            'pending_zones': row['pending_zones'],
+            'tasks_awaiting_verification': row['tasks_awaiting_verification']
+        }
+        _moderation_counters['value'] = counters
+        _moderation_counters['expires'] = time.monotonic() + MODERATION_COUNTERS_TTL
+
+    if has_app_context():
+        g._moderation_counters = counters
+    return counters
+
+
+def invalidate_moderation_counters():
+    """Сбросить кэш счетчиков после изменения зон или задач"""
+    _moderation_counters['value'] = None
+    if has_app_context():
+        g.pop('_moderation_counters', None)
+
+
 def approve_zone(zone_id, approved_by_user_id):
     """Одобрить зеленую зону"""
     conn = get_db_connection()
+    zone = conn.execute('SELECT status FROM green_zones WHERE id = ?', (zone_id,)).fetchone()
     conn.execute('''
         UPDATE green_zones 
         SET status = 'approved', approved_by = ?, approved_date = CURRENT_TIMESTAMP 
         WHERE id = ?
     ''', (approved_by_user_id, zone_id))
+    if zone and zone['status'] != 'approved':
+        count_approved_zone(conn, zone_id, 1)
+    bump_data_version(conn, 'zones')
+    bump_zone_city_version(conn, zone_id)
     conn.commit()
     conn.close()
+    invalidate_moderation_counters()
 
 
 def reject_zone(zone_id, rejected_by_user_id, reason):
     """Отклонить зеленую зону"""
     conn = get_db_connection()
+    zone = conn.execute('SELECT status FROM green_zones WHERE id = ?', (zone_id,)).fetchone()
     conn.execute('''
         UPDATE green_zones 
         SET status = 'rejected', approved_by = ?, rejection_reason = ? 
         WHERE id = ?
     ''', (rejected_by_user_id, reason, zone_id))
+    if zone and zone['status'] == 'approved':
+        count_approved_zone(conn, zone_id, -1)
+    bump_data_version(conn, 'zones')
+    bump_zone_city_version(conn, zone_id)
     conn.commit()
     conn.close()
+    invalidate_moderation_counters()
 
 
-def get_approved_zones_for_city(city_name=None, user_city=None):
-    """Получить одобренные зоны для города"""
+def parse_coordinates(coordinates):
+    """Разобрать строку "lat,lon" в пару чисел; None для пустых и некорректных"""
+    if not coordinates:
+        return None
+    try:
+        lat_str, lon_str = coordinates.strip().replace(' ', '').split(',')
+        lat, lon = float(lat_str), float(lon_str)
+    except (ValueError, AttributeError):
+        return None
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None
+
+
+def backfill_zone_coordinates(conn):
+    """Заполнить числовые lat/lon для зон, у которых есть только строка coordinates"""
+    zones = conn.execute('''
+        SELECT id, coordinates FROM green_zones
+        WHERE lat IS NULL AND coordinates IS NOT NULL
+    ''').fetchall()
+
+    updates = []
+    for zone_id, coordinates in zones:
+        point = parse_coordinates(coordinates)
+        if point:
+            updates.append((point[0], point[1], zone_id))
+
+    conn.executemany('UPDATE green_zones SET lat = ?, lon = ? WHERE id = ?', updates)
+    return len(updates)
+
+
+def parse_bbox(value):
+    """Разобрать bbox "minLon,minLat,maxLon,maxLat"; ValueError для некорректного"""
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4:
+        raise ValueError('bbox must have 4 numbers')
+    min_lon, min_lat, max_lon, max_lat = parts
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError('bbox min must not exceed max')
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def _approved_zones_query(city=None, bbox=None, after=None, limit=None):
+    """SQL и параметры выборки одобренных зон (см. get_approved_zones_for_city)"""
+    query = '''
+        SELECT gz.*, c.name as city_name,
+               COALESCE(zs.health_sum * 1.0 / NULLIF(zs.health_count, 0), 0) as avg_health,
+               COALESCE(zs.health_count, 0) as health_count,
+               COALESCE(zs.pending_tasks, 0) as pending_tasks,
+               COALESCE(zs.critical_tasks, 0) as critical_tasks,
+               COALESCE(zs.report_count, 0) as report_count,
+               zs.last_report_date
+        FROM green_zones gz
+        JOIN cities c ON gz.city_id = c.id
+        LEFT JOIN zone_stats zs ON zs.zone_id = gz.id
+    '''
+    conditions = ["gz.status = 'approved'"]
+    params = []
+    if city:
+        conditions.append('gz.city_id = (SELECT id FROM cities WHERE name = ?)')
+        params.append(city)
+    if bbox:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        # R*Tree хранит float32 с округлением наружу, поэтому точную границу проверяем по lat/lon
+        conditions.append('''gz.id IN (
+            SELECT id FROM zone_rtree
+            WHERE max_lon >= ? AND min_lon <= ? AND max_lat >= ? AND min_lat <= ?
+        ) AND gz.lon BETWEEN ? AND ? AND gz.lat BETWEEN ? AND ?''')
+        params.extend([min_lon, max_lon, min_lat, max_lat, min_lon, max_lon, min_lat, max_lat])
+
+    if after is not None:
+        conditions.append('gz.id > ?')
+        params.append(after)
+
+    query += ' WHERE ' + ' AND '.join(conditions)
+    if after is not None or limit is not None:
+        query += ' ORDER BY gz.id'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+
+    return query, params
+
+
+def get_approved_zones_for_city(city_name=None, user_city=None, bbox=None, after=None, limit=None):
+    """Получить одобренные зоны для города вместе с агрегатами из zone_stats.
+
+    bbox - (min_lon, min_lat, max_lon, max_lat), ограничивает выборку через индекс zone_rtree.
+    after/limit - постраничная выборка по возрастанию id: зоны с id больше after, не больше limit.
+    """
+    query, params = _approved_zones_query(city_name or user_city, bbox, after, limit)
     conn = get_db_connection()
+    zones = conn.execute(query, params).fetchall()
+
+    conn.close()
+    return zones
+
+
+def iter_approved_zones(city_name=None, bbox=None, after=None, limit=None):
+    """То же, что get_approved_zones_for_city, но строки читаются из курсора по одной"""
+    query, params = _approved_zones_query(city_name, bbox, after, limit)
+    conn = get_db_connection()
+    try:
+        yield from conn.execute(query, params)
+    finally:
+        conn.close()
+
 
+def get_zone_extent(city_name=None):
+    """Число одобренных зон с координатами и их границы (min_lon, min_lat, max_lon, max_lat)"""
+    conn = get_db_connection()
+    query = '''
+        SELECT COUNT(lat) as count, MIN(lon) as min_lon, MIN(lat) as min_lat,
+               MAX(lon) as max_lon, MAX(lat) as max_lat
+        FROM green_zones
+        WHERE status = 'approved' AND lat IS NOT NULL
+    '''
     if city_name:
-        zones = conn.execute('''
-            SELECT gz.*, 
-                   COALESCE(AVG(zr.health_score), 0) as avg_health,
-                   COUNT(CASE WHEN mt.status = "pending" THEN 1 END) as pending_tasks
-            FROM green_zones gz
-            LEFT JOIN zone_reports zr ON gz.id = zr.zone_id
-            LEFT JOIN maintenance_tasks mt ON gz.id = mt.zone_id
-            WHERE gz.city_id = (SELECT id FROM cities WHERE name = ?) 
-            AND gz.status = 'approved'
-            GROUP BY gz.id
-        ''', (city_name,)).fetchall()
-    elif user_city:
-        zones = conn.execute('''
-            SELECT gz.*, 
-                   COALESCE(AVG(zr.health_score), 0) as avg_health,
-                   COUNT(CASE WHEN mt.status = "pending" THEN 1 END) as pending_tasks
-            FROM green_zones gz
-            LEFT JOIN zone_reports zr ON gz.id = zr.zone_id
-            LEFT JOIN maintenance_tasks mt ON gz.id = mt.zone_id
-            WHERE gz.city_id = (SELECT id FROM cities WHERE name = ?) 
-            AND gz.status = 'approved'
-            GROUP BY gz.id
-        ''', (user_city,)).fetchall()
+        extent = conn.execute(query + ' AND city_id = (SELECT id FROM cities WHERE name = ?)',
+                              (city_name,)).fetchone()
     else:
-        zones = conn.execute('''
-            SELECT gz.*, 
-                   COALESCE(AVG(zr.health_score), 0) as avg_health,
-                   COUNT(CASE WHEN mt.status = "pending" THEN 1 END) as pending_tasks
-            FROM green_zones gz
-            LEFT JOIN zone_reports zr ON gz.id = zr.zone_id
-            LEFT JOIN maintenance_tasks mt ON gz.id = mt.zone_id
-            WHERE gz.status = 'approved'
-            GROUP BY gz.id
-        ''').fetchall()
+        extent = conn.execute(query).fetchone()
+    conn.close()
+    return extent
+
+
+# Агрегаты по зонам (zone_stats) обновляются в той же транзакции, что и изменение данных
+
+def record_zone_report(conn, zone_id, health_score):
+    """Учесть новый отчет в агрегатах зоны и в сводках city_stats"""
+    conn.execute('''
+        INSERT INTO zone_stats (zone_id, city_id, report_count, health_count, health_sum, last_report_date)
+        SELECT id, city_id, 1, ?, ?, CURRENT_TIMESTAMP FROM green_zones WHERE id = ?
+        ON CONFLICT(zone_id) DO UPDATE SET
+            report_count = report_count + 1,
+            health_count = health_count + excluded.health_count,
+            health_sum = health_sum + excluded.health_sum,
+            last_report_date = excluded.last_report_date
+    ''', (0 if health_score is None else 1, health_score or 0, zone_id))
+    adjust_city_stats(conn, zone_id, health_count=0 if health_score is None else 1, health_sum=health_score or 0)
+
+
+def _zone_task_counts(conn, zone_id):
+    row = conn.execute('SELECT pending_tasks, critical_tasks FROM zone_stats WHERE zone_id = ?',
+                       (zone_id,)).fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+def refresh_zone_task_stats(conn, zone_id):
+    """Пересчитать счетчики задач зоны (по индексу zone_id, status) и перенести разницу в city_stats"""
+    old_pending, old_critical = _zone_task_counts(conn, zone_id)
+    conn.execute('''
+        INSERT INTO zone_stats (zone_id, city_id, pending_tasks, critical_tasks)
+        SELECT gz.id, gz.city_id,
+               (SELECT COUNT(*) FROM maintenance_tasks
+                WHERE zone_id = gz.id AND status = 'pending'),
+               (SELECT COUNT(*) FROM maintenance_tasks
+                WHERE zone_id = gz.id AND status = 'pending' AND priority = 'high')
+        FROM green_zones gz
+        WHERE gz.id = ?
+        ON CONFLICT(zone_id) DO UPDATE SET
+            pending_tasks = excluded.pending_tasks,
+            critical_tasks = excluded.critical_tasks
+    ''', (zone_id,))
+    pending, critical = _zone_task_counts(conn, zone_id)
+    if pending != old_pending or critical != old_critical:
+        adjust_city_stats(conn, zone_id, pending=pending - old_pending, critical=critical - old_critical)
+
+
+def delete_zone_stats(conn, zone_id):
+    """Удалить агрегаты удаленной зоны и вычесть их из сводок city_stats (вызывать до удаления зоны)"""
+    zone = conn.execute('''
+        SELECT gz.status, COALESCE(zs.pending_tasks, 0), COALESCE(zs.critical_tasks, 0),
+               COALESCE(zs.health_count, 0), COALESCE(zs.health_sum, 0)
+        FROM green_zones gz LEFT JOIN zone_stats zs ON zs.zone_id = gz.id
+        WHERE gz.id = ?
+    ''', (zone_id,)).fetchone()
+    if zone:
+        if zone[0] == 'approved':
+            count_approved_zone(conn, zone_id, -1)
+        _add_city_stats(conn, 0, pending=-zone[1], critical=-zone[2], health_count=-zone[3], health_sum=-zone[4])
+    conn.execute('DELETE FROM zone_stats WHERE zone_id = ?', (zone_id,))
+
+
+def rebuild_zone_stats(conn=None):
+    """Полностью пересчитать zone_stats из отчетов и задач"""
+    own_connection = conn is None
+    if own_connection:
+        conn = get_db_connection()
+
+    conn.execute('DELETE FROM zone_stats')
+    conn.execute('''
+        INSERT INTO zone_stats
+            (zone_id, city_id, report_count, health_count, health_sum, last_report_date,
+             pending_tasks, critical_tasks)
+        SELECT gz.id, gz.city_id,
+               COALESCE(r.report_count, 0), COALESCE(r.health_count, 0), COALESCE(r.health_sum, 0),
+               r.last_report_date,
+               COALESCE(t.pending_tasks, 0), COALESCE(t.critical_tasks, 0)
+        FROM green_zones gz
+        LEFT JOIN (
+            SELECT zone_id, COUNT(*) as report_count, COUNT(health_score) as health_count,
+                   SUM(health_score) as health_sum, MAX(report_date) as last_report_date
+            FROM zone_reports
+            GROUP BY zone_id
+        ) r ON r.zone_id = gz.id
+        LEFT JOIN (
+            SELECT zone_id, COUNT(*) as pending_tasks,
+                   SUM(CASE WHEN priority = 'high' THEN 1 ELSE 0 END) as critical_tasks
+            FROM maintenance_tasks
+            WHERE status = 'pending'
+            GROUP BY zone_id
+        ) t ON t.zone_id = gz.id
+    ''')
+
+    if own_connection:
+        conn.commit()
+        conn.close()
 
+
+# Сводка по городам (city_stats) меняется приращениями в транзакции записи: код, изменивший
+# агрегаты зоны в zone_stats, прибавляет ту же разницу к строке города и к общей строке
+# с city_id = 0. Полный пересчет - только в rebuild_city_stats.
+# Строка города учитывает одобренные зоны города и активные организации города. Общая строка,
+# как и прежние запросы главной страницы, - одобренные зоны, все задачи и отчеты (в том числе
+# по неодобренным зонам) и все активные организации (в том числе без города)
+
+CITY_STATS_SELECT = '''
+    SELECT c.id, COUNT(gz.id), COALESCE(SUM(zs.pending_tasks), 0), COALESCE(SUM(zs.critical_tasks), 0),
+           COALESCE(SUM(zs.health_count), 0), COALESCE(SUM(zs.health_sum), 0),
+           (SELECT COUNT(*) FROM organizations WHERE city_id = c.id AND is_active = 1)
+    FROM cities c
+    LEFT JOIN green_zones gz ON gz.city_id = c.id AND gz.status = 'approved'
+    LEFT JOIN zone_stats zs ON zs.zone_id = gz.id
+'''
+
+CITY_STATS_COLUMNS = '''(city_id, total_zones, pending_tasks, critical_tasks,
+                          health_count, health_sum, total_organizations)'''
+
+
+GLOBAL_STATS_SELECT = '''
+    SELECT 0, (SELECT COUNT(*) FROM green_zones WHERE status = 'approved'),
+           COALESCE(SUM(pending_tasks), 0), COALESCE(SUM(critical_tasks), 0),
+           COALESCE(SUM(health_count), 0), COALESCE(SUM(health_sum), 0),
+           (SELECT COUNT(*) FROM organizations WHERE is_active = 1)
+    FROM zone_stats
+'''
+
+
+def _add_city_stats(conn, city_id, zones=0, pending=0, critical=0, health_count=0, health_sum=0, organizations=0):
+    conn.execute(f'''
+        INSERT INTO city_stats {CITY_STATS_COLUMNS} VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(city_id) DO UPDATE SET
+            total_zones = total_zones + excluded.total_zones,
+            pending_tasks = pending_tasks + excluded.pending_tasks,
+            critical_tasks = critical_tasks + excluded.critical_tasks,
+            health_count = health_count + excluded.health_count,
+            health_sum = health_sum + excluded.health_sum,
+            total_organizations = total_organizations + excluded.total_organizations
+    ''', (city_id, zones, pending, critical, health_count, health_sum, organizations))
+
+
+def adjust_city_stats(conn, zone_id, pending=0, critical=0, health_count=0, health_sum=0):
+    """Прибавить изменение агрегатов зоны к сводке ее города (если зона одобрена) и к общей сводке"""
+    zone = conn.execute('SELECT city_id, status FROM green_zones WHERE id = ?', (zone_id,)).fetchone()
+    if zone is None:
+        return
+    if zone['status'] == 'approved':
+        _add_city_stats(conn, zone['city_id'], pending=pending, critical=critical,
+                        health_count=health_count, health_sum=health_sum)
+    _add_city_stats(conn, 0, pending=pending, critical=critical, health_count=health_count, health_sum=health_sum)
+
+
+def count_approved_zone(conn, zone_id, sign):
+    """Учесть зону, ставшую одобренной (sign=1), или убрать зону, переставшую ею быть (sign=-1).
+
+    Сводка города получает и саму зону, и ее агрегаты; общая сводка - только число зон,
+    потому что задачи и отчеты в ней учитываются независимо от статуса зоны.
+    """
+    zone = conn.execute('''
+        SELECT gz.city_id, COALESCE(zs.pending_tasks, 0), COALESCE(zs.critical_tasks, 0),
+               COALESCE(zs.health_count, 0), COALESCE(zs.health_sum, 0)
+        FROM green_zones gz LEFT JOIN zone_stats zs ON zs.zone_id = gz.id
+        WHERE gz.id = ?
+    ''', (zone_id,)).fetchone()
+    if zone is None:
+        return
+    _add_city_stats(conn, zone[0], zones=sign, pending=sign * zone[1], critical=sign * zone[2],
+                    health_count=sign * zone[3], health_sum=sign * zone[4])
+    _add_city_stats(conn, 0, zones=sign)
+
+
+def count_organization(conn, city_id, sign=1):
+    """Учесть новую активную организацию (sign=-1 - убрать) в сводке города и в общей сводке"""
+    if city_id:
+        _add_city_stats(conn, city_id, organizations=sign)
+    _add_city_stats(conn, 0, organizations=sign)
+
+
+def delete_city_stats(conn, city_id):
+    """Удалить сводку удаленного города (общая сводка, как и раньше, учитывает его данные)"""
+    conn.execute('DELETE FROM city_stats WHERE city_id = ?', (city_id,))
+
+
+def rebuild_city_stats(conn=None):
+    """Полностью пересчитать city_stats (после rebuild_zone_stats)"""
+    own_connection = conn is None
+    if own_connection:
+        conn = get_db_connection()
+
+    conn.execute('DELETE FROM city_stats')
+    conn.execute(f'INSERT INTO city_stats {CITY_STATS_COLUMNS} {CITY_STATS_SELECT} GROUP BY c.id')
+    conn.execute(f'INSERT INTO city_stats {CITY_STATS_COLUMNS} {GLOBAL_STATS_SELECT}')
+
+    if own_connection:
+        conn.commit()
+        conn.close()
+
+
+def get_dashboard_stats(city_name=None):
+    """Пять показателей главной страницы для города (без города - по всем) одним чтением"""
+    city = get_city(city_name) if city_name else None
+    city_id = city['id'] if city else 0
+
+    conn = get_db_connection()
+    row = conn.execute('''
+        SELECT total_zones, pending_tasks, critical_tasks, total_organizations,
+               COALESCE(health_sum * 1.0 / NULLIF(health_count, 0), 0) as avg_health
+        FROM city_stats WHERE city_id = ?
+    ''', (city_id,)).fetchone()
     conn.close()
-    return zones
+
+    if row is None:
+        return {'total_zones': 0, 'pending_tasks': 0, 'critical_tasks': 0, 'avg_health': 0, 'total_organizations': 0}
+    return dict(row)
+
+
+# Счетчики активности пользователей (user_stats) меняются в транзакции записи
+
+def adjust_user_stats(conn, user_id, zones=0, reports=0, tasks=0):
+    """Изменить счетчики пользователя: добавленные зоны, отправленные отчеты, созданные задачи"""
+    if user_id is None:
+        return
+    conn.execute('''
+        INSERT INTO user_stats (user_id, zones_added, reports_submitted, tasks_created) VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            zones_added = zones_added + excluded.zones_added,
+            reports_submitted = reports_submitted + excluded.reports_submitted,
+            tasks_created = tasks_created + excluded.tasks_created
+    ''', (user_id, zones, reports, tasks))
+
+
+def forget_zone_activity(conn, zone_id):
+    """Вычесть из счетчиков пользователей зону, ее отчеты и задачи (вызывать до их удаления)"""
+    zone = conn.execute('SELECT created_by FROM green_zones WHERE id = ?', (zone_id,)).fetchone()
+    if zone:
+        adjust_user_stats(conn, zone['created_by'], zones=-1)
+
+    reporters = conn.execute('''
+        SELECT reporter_id, COUNT(*) FROM zone_reports WHERE zone_id = ? GROUP BY reporter_id
+    ''', (zone_id,)).fetchall()
+    for reporter_id, count in reporters:
+        adjust_user_stats(conn, reporter_id, reports=-count)
+
+    creators = conn.execute('''
+        SELECT created_by, COUNT(*) FROM maintenance_tasks WHERE zone_id = ? GROUP BY created_by
+    ''', (zone_id,)).fetchall()
+    for created_by, count in creators:
+        adjust_user_stats(conn, created_by, tasks=-count)
+
+
+def rebuild_user_stats(conn=None):
+    """Полностью пересчитать user_stats из зон, отчетов и задач"""
+    own_connection = conn is None
+    if own_connection:
+        conn = get_db_connection()
+
+    conn.execute('DELETE FROM user_stats')
+    conn.execute('''
+        INSERT INTO user_stats (user_id, zones_added, reports_submitted, tasks_created)
+        SELECT u.id,
+               (SELECT COUNT(*) FROM green_zones WHERE created_by = u.id),
+               (SELECT COUNT(*) FROM zone_reports WHERE reporter_id = u.id),
+               (SELECT COUNT(*) FROM maintenance_tasks WHERE created_by = u.id)
+        FROM users u
+    ''')
+
+    if own_connection:
+        conn.commit()
+        conn.close()
+
+
+def get_user_stats(user_id):
+    """Счетчики активности пользователя одной строкой"""
+    conn = get_db_connection()
+    row = conn.execute('''
+        SELECT zones_added, reports_submitted, tasks_created FROM user_stats WHERE user_id = ?
+    ''', (user_id,)).fetchone()
+    conn.close()
+    if row is None:
+        return {'zones_added': 0, 'reports_submitted': 0, 'tasks_created': 0}
+    return dict(row)
 
 
 def create_task(zone_id, city_id, task_type, description, priority, created_by):
@@ -538,6 +1281,9 @@ def create_task(zone_id, city_id, task_type, description, priority, created_by):
     ''', (zone_id, city_id, task_type, description, priority, created_by))
 
     task_id = cursor.lastrowid
+    refresh_zone_task_stats(conn, zone_id)
+    adjust_user_stats(conn, created_by, tasks=1)
+    bump_zone_city_version(conn, zone_id)
     conn.commit()
     conn.close()
 
@@ -547,9 +1293,15 @@ def create_task(zone_id, city_id, task_type, description, priority, created_by):
 def delete_task(task_id):
     """Удалить задачу"""
     conn = get_db_connection()
+    task = conn.execute('SELECT zone_id, created_by FROM maintenance_tasks WHERE id = ?', (task_id,)).fetchone()
     conn.execute('DELETE FROM maintenance_tasks WHERE id = ?', (task_id,))
+    if task:
+        refresh_zone_task_stats(conn, task['zone_id'])
+        adjust_user_stats(conn, task['created_by'], tasks=-1)
+        bump_zone_city_version(conn, task['zone_id'])
     conn.commit()
     conn.close()
+    invalidate_moderation_counters()
 
 
 def update_task_status(task_id, status, user_id=None):
@@ -575,8 +1327,14 @@ def update_task_status(task_id, status, user_id=None):
             WHERE id = ?
         ''', (status, task_id))
 
+    task = conn.execute('SELECT zone_id FROM maintenance_tasks WHERE id = ?', (task_id,)).fetchone()
+    if task:
+        refresh_zone_task_stats(conn, task['zone_id'])
+        bump_zone_city_version(conn, task['zone_id'])
+
     conn.commit()
     conn.close()
+    invalidate_moderation_counters()
 
 
 def get_tasks_for_zone(zone_id):
@@ -661,6 +1419,8 @@ def create_organization(name, org_type, description, contact_person, phone, emai
     ''', (name, org_type, description, contact_person, phone, email, website, city_id, created_by))
 
     org_id = cursor.lastrowid
+    count_organization(conn, city_id)
+    bump_city_version(conn, city_id)
     conn.commit()
     conn.close()
 
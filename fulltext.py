@@ -0,0 +1,97 @@
+import re
+
+import database
+
+# Размер страницы результатов поиска
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 50
+
+SEARCH_TYPES = ('zone', 'report', 'organization')
+
+# Окончания, которые отбрасываются перед поиском по префиксу ("парки" -> "парк*").
+# Полноценного русского стеммера в FTS5 нет, поэтому префиксный поиск по основе
+# находит большинство словоформ
+_ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ых', 'их',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ов', 'ев',
+    'ах', 'ях', 'ам', 'ям', 'ом', 'ем', 'ы', 'и', 'а', 'я', 'о', 'е', 'у', 'ю', 'ь'
+), key=len, reverse=True)
+_MIN_STEM = 3
+
+_TOKEN = re.compile(r'\w+')
+
+
+def fold(text):
+    """Текст в том виде, в котором он хранится в индексе: ё -> е"""
+    return str(text or '').replace('ё', 'е').replace('Ё', 'Е')
+
+
+def stem(token):
+    """Грубая основа слова: без одного типового окончания"""
+    for ending in _ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= _MIN_STEM:
+            return token[:-len(ending)]
+    return token
+
+
+def build_match_query(text):
+    """Запрос FTS5 MATCH: все слова обязательны, каждое ищется по префиксу основы"""
+    tokens = _TOKEN.findall(fold(text).casefold())
+    return ' '.join(f'"{stem(token)}"*' for token in tokens)
+
+
+_ZONES_QUERY = '''
+    SELECT 'zone' AS type, gz.id AS id, gz.id AS zone_id, gz.name AS title,
+           snippet(zones_fts, -1, '[', ']', '…', 12) AS snippet, c.name AS city_name,
+           bm25(zones_fts, 10.0, 3.0) AS rank
+    FROM zones_fts
+    JOIN green_zones gz ON gz.id = zones_fts.rowid
+    JOIN cities c ON c.id = gz.city_id
+    WHERE zones_fts MATCH :match AND gz.status = 'approved'
+      AND (:city_id IS NULL OR gz.city_id = :city_id)
+'''
+
+_REPORTS_QUERY = '''
+    SELECT 'report' AS type, zr.id AS id, zr.zone_id AS zone_id, gz.name AS title,
+           snippet(report_notes_fts, 0, '[', ']', '…', 12) AS snippet, c.name AS city_name,
+           bm25(report_notes_fts) AS rank
+    FROM report_notes_fts
+    JOIN zone_reports zr ON zr.id = report_notes_fts.rowid
+    JOIN green_zones gz ON gz.id = zr.zone_id
+    JOIN cities c ON c.id = gz.city_id
+    WHERE report_notes_fts MATCH :match AND gz.status = 'approved'
+      AND (:city_id IS NULL OR gz.city_id = :city_id)
+'''
+
+_ORGANIZATIONS_QUERY = '''
+    SELECT 'organization' AS type, o.id AS id, NULL AS zone_id, o.name AS title,
+           snippet(organizations_fts, -1, '[', ']', '…', 12) AS snippet, c.name AS city_name,
+           bm25(organizations_fts, 10.0, 1.0) AS rank
+    FROM organizations_fts
+    JOIN organizations o ON o.id = organizations_fts.rowid
+    LEFT JOIN cities c ON c.id = o.city_id
+    WHERE organizations_fts MATCH :match AND o.is_active = 1
+      AND (:city_id IS NULL OR o.city_id = :city_id)
+'''
+
+_QUERIES = {'zone': _ZONES_QUERY, 'report': _REPORTS_QUERY, 'organization': _ORGANIZATIONS_QUERY}
+
+
+def search(text, city_id=None, types=SEARCH_TYPES, limit=SEARCH_PAGE_SIZE, offset=0):
+    """Найденные зоны, заметки отчетов и организации, лучшие первыми.
+
+    Возвращает (список результатов, есть ли следующая страница).
+    """
+    match = build_match_query(text)
+    selects = [_QUERIES[kind] for kind in SEARCH_TYPES if kind in types]
+    if not match or not selects:
+        return [], False
+
+    conn = database.get_db_connection()
+    rows = conn.execute(
+        ' UNION ALL '.join(selects) + ' ORDER BY rank LIMIT :limit OFFSET :offset',
+        {'match': match, 'city_id': city_id, 'limit': limit + 1, 'offset': offset}
+    ).fetchall()
+    conn.close()
+
+    return rows[:limit], len(rows) > limit
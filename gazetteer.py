@@ -0,0 +1,168 @@
+import csv
+import math
+import sys
+import time
+
+import database
+import ratelimit
+
+# Центры городов из начального списка add_sample_data: (широта, долгота)
+CITY_CENTROIDS = {
+    'Барнаул': (53.3481, 83.7798),
+    'Бийск': (52.5186, 85.2072),
+    'Рубцовск': (51.5147, 81.2061),
+    'Котельниково': (47.6312, 43.1428),
+    'Ленинск-Кузнецкий': (54.6567, 86.1737),
+    'Полысаево': (54.6055, 86.2809),
+    'Прокопьевск': (53.8864, 86.7194),
+    'Мыски': (53.7125, 87.8056),
+    'Кемерово': (55.3547, 86.0873),
+    'Бородино': (55.9056, 94.9006),
+    'Назарово': (56.0064, 90.3914),
+    'Шарыпово': (55.5389, 89.1801),
+    'Ковдор': (67.5661, 30.4744),
+    'Кингисепп': (59.3733, 28.6134),
+    'Березники': (59.4091, 56.8204),
+    'Усолье': (59.4275, 56.6833),
+    'Абакан': (53.7212, 91.4424),
+    'Черногорск': (53.8236, 91.2842),
+    'Рефтинский': (57.0883, 61.6717),
+    'Чегдомын': (51.1178, 133.0242),
+}
+
+
+def approximate_bbox(lat, lon, population):
+    """Примерные границы города по центру и населению: (min_lon, min_lat, max_lon, max_lat)"""
+    # Полуразмер от 2 до 15 км, растет как корень из населения
+    half_km = min(max(math.sqrt(population or 0) / 60, 2), 15)
+    dlat = half_km / 111.32
+    dlon = half_km / (111.32 * max(math.cos(math.radians(lat)), 0.01))
+    return (round(lon - dlon, 6), round(lat - dlat, 6), round(lon + dlon, 6), round(lat + dlat, 6))
+
+
+def set_city_coordinates(conn, city_id, lat, lon, bbox):
+    """Сохранить центр и границы города (вызывающий делает commit)"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    conn.execute('''
+        UPDATE cities SET lat = ?, lon = ?, min_lon = ?, min_lat = ?, max_lon = ?, max_lat = ?
+        WHERE id = ?
+    ''', (lat, lon, min_lon, min_lat, max_lon, max_lat, city_id))
+
+
+def backfill_city_coordinates(conn):
+    """Заполнить координаты городов без них из CITY_CENTROIDS; число обновленных городов"""
+    cities = conn.execute('SELECT id, name, population FROM cities WHERE lat IS NULL').fetchall()
+    updated = 0
+    for city_id, name, population in cities:
+        centroid = CITY_CENTROIDS.get(name)
+        if centroid is None:
+            continue
+        lat, lon = centroid
+        set_city_coordinates(conn, city_id, lat, lon, approximate_bbox(lat, lon, population))
+        updated += 1
+    return updated
+
+
+def locate_city(name, region=None, population=None):
+    """Центр и границы нового города: (lat, lon, bbox) или None.
+
+    Сначала CITY_CENTROIDS, затем геокодер через кэш и общий лимит запросов. В запросе
+    ждать токен нельзя, поэтому при исчерпанном лимите или ошибке сервиса возвращает None -
+    такой город потом дозаполнит fetch_missing.
+    """
+    import maps
+
+    centroid = CITY_CENTROIDS.get(name)
+    if centroid is not None:
+        lat, lon = centroid
+        return lat, lon, approximate_bbox(lat, lon, population)
+
+    try:
+        place = maps.MapService.lookup_city(name, region)
+    except Exception as e:
+        print(f"⚠️ Не удалось получить координаты города {name}: {e}")
+        return None
+    if place is None:
+        return None
+    return place['lat'], place['lon'], place['bounds']
+
+
+def import_csv(path):
+    """Массовый импорт городов из CSV.
+
+    Колонки: name, region, population, lat, lon и необязательные min_lon, min_lat,
+    max_lon, max_lat. Существующие города обновляются, новые добавляются.
+    """
+    conn = database.get_db_connection()
+    count = 0
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            lat, lon = float(row['lat']), float(row['lon'])
+            population = int(row['population']) if row.get('population') else None
+            conn.execute('''
+                INSERT INTO cities (name, region, population) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    region = COALESCE(excluded.region, region),
+                    population = COALESCE(excluded.population, population)
+            ''', (row['name'], row.get('region') or None, population))
+            city_id, population = conn.execute(
+                'SELECT id, population FROM cities WHERE name = ?', (row['name'],)
+            ).fetchone()
+
+            if row.get('min_lon'):
+                bbox = tuple(float(row[key]) for key in ('min_lon', 'min_lat', 'max_lon', 'max_lat'))
+            else:
+                bbox = approximate_bbox(lat, lon, population)
+            set_city_coordinates(conn, city_id, lat, lon, bbox)
+            count += 1
+
+    database.invalidate_reference_data(conn)
+    conn.commit()
+    conn.close()
+    return count
+
+
+def fetch_missing():
+    """Дозаполнить координаты городов, которых нет в CITY_CENTROIDS, через Nominatim"""
+    import maps
+
+    conn = database.get_db_connection()
+    cities = conn.execute('SELECT id, name, region FROM cities WHERE lat IS NULL').fetchall()
+    conn.close()
+
+    # Сначала все запросы к геокодеру: лимит запросов и кэш геокодирования пишут в БД
+    # через другие соединения, поэтому открытая здесь транзакция записи их бы блокировала
+    found = []
+    for city_id, name, region in cities:
+        while True:
+            try:
+                place = maps.MapService.lookup_city(name, region)
+                break
+            except ratelimit.RateLimited as e:
+                # Вне запроса можно подождать, пока в общем ведре появится токен
+                time.sleep(e.retry_after)
+        if place is None:
+            print(f"⚠️ Координаты не найдены: {name}")
+            continue
+        found.append((city_id, place))
+
+    if found:
+        conn = database.get_db_connection()
+        for city_id, place in found:
+            set_city_coordinates(conn, city_id, place['lat'], place['lon'], place['bounds'])
+        database.invalidate_reference_data(conn)
+        conn.commit()
+        conn.close()
+    return len(found)
+
+
+if __name__ == '__main__':
+    import migrations
+
+    migrations.migrate()
+    if len(sys.argv) > 2 and sys.argv[1] == 'import':
+        print(f"📥 Импортировано городов: {import_csv(sys.argv[2])}")
+    elif len(sys.argv) > 1 and sys.argv[1] == 'fetch':
+        print(f"🌍 Найдено координат: {fetch_missing()}")
+    else:
+        print("Использование: python gazetteer.py import <cities.csv> | fetch")
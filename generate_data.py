@@ -0,0 +1,449 @@
+"""Генератор большого синтетического набора данных для нагрузочных тестов.
+
+    python generate_data.py --db bench.db --cities 1000 --zones 500000 --reports 20000000 --tasks 2000000
+
+Распределения неравномерные, как в реальных данных: население городов
+убывает по закону Ципфа, зоны распределены по городам пропорционально
+населению, у части зон отчетов на порядки больше, чем у остальных. Даты
+охватывают последние --days дней: новых зон больше, чем старых, отчеты
+чаще летом и днем. Набор воспроизводится при том же --seed.
+
+Строки вставляются пакетами executemany в больших транзакциях; вторичные
+индексы и триггеры вставки на время загрузки удаляются, в конце индексы
+создаются заново, а пространственный и полнотекстовые индексы заполняются
+одним запросом на таблицу. После
+загрузки пересчитываются агрегаты (zone_stats, city_stats, user_stats).
+"""
+import argparse
+import math
+import os
+import random
+import sqlite3
+import time
+
+import database
+import gazetteer
+import migrations
+
+ZONE_TYPES = ('Парк', 'Сквер', 'Аллея', 'Детская площадка', 'Спортивная площадка', 'Газон', 'Цветник', 'Лесопарк')
+ZONE_TYPE_WEIGHTS = (12, 25, 10, 20, 8, 15, 7, 3)
+# Средняя площадь зоны каждого типа, га
+ZONE_TYPE_AREA = (8.0, 1.2, 0.8, 0.3, 0.6, 0.5, 0.1, 40.0)
+
+ZONE_NAME_PREFIXES = ('Сквер', 'Парк', 'Аллея', 'Бульвар', 'Сад', 'Роща', 'Площадка', 'Газон')
+ZONE_NAME_SUBJECTS = ('Победы', 'Мира', 'Дружбы', 'Юбилейный', 'Молодежный', 'Центральный', 'Солнечный',
+                      'Березовый', 'Кленовый', 'Липовый', 'Школьный', 'Семейный', 'Северный', 'Южный',
+                      'Речной', 'Заводской', 'Спортивный', 'Детский', 'Горняков', 'Строителей')
+STREETS = ('Ленина', 'Мира', 'Советская', 'Гагарина', 'Садовая', 'Школьная', 'Молодежная', 'Лесная',
+           'Набережная', 'Победы', 'Пушкина', 'Строителей', 'Заводская', 'Октябрьская', 'Полевая')
+
+CITY_ROOTS = ('Зелено', 'Красно', 'Ново', 'Старо', 'Бело', 'Черно', 'Верхне', 'Нижне', 'Светло', 'Камен',
+              'Лесо', 'Озер', 'Речн', 'Степно', 'Сосно', 'Берез', 'Железно', 'Медно', 'Солне', 'Ясно')
+CITY_SUFFIXES = ('горск', 'дольск', 'речье', 'польск', 'озерск', 'град', 'ярск', 'борск', 'водск', 'ковск')
+REGIONS = ('Алтайский край', 'Кемеровская область', 'Красноярский край', 'Мурманская область',
+           'Ленинградская область', 'Пермский край', 'Республика Хакасия', 'Свердловская область',
+           'Хабаровский край', 'Волгоградская область', 'Новосибирская область', 'Омская область',
+           'Томская область', 'Иркутская область', 'Челябинская область', 'Тюменская область')
+
+TASK_TYPES = ('watering', 'pruning', 'cleaning', 'repair', 'planting', 'fertilizing')
+TASK_STATUSES = ('completed', 'pending', 'in_progress', 'verification_requested')
+TASK_STATUS_WEIGHTS = (55, 20, 15, 10)
+PRIORITIES = ('low', 'medium', 'high')
+ORG_TYPES = ('non-profit', 'commercial', 'governmental', 'educational')
+
+REPORT_NOTES = ('Состояние хорошее', 'Требуется обрезка кустарника', 'Много мусора у входа',
+                'Сломана скамейка', 'Газон вытоптан', 'Нужен полив, трава пожелтела',
+                'Деревья в хорошем состоянии', 'Повреждено ограждение', 'Цветник ухожен',
+                'После ливня размыта дорожка', 'Сухие ветки над тропинкой', 'Не работает освещение')
+# Доля отчетов с текстом (текст попадает в полнотекстовый индекс)
+REPORT_NOTES_SHARE = 0.2
+
+DEFAULT_BATCH = 50000
+# Пакетов на одну транзакцию
+BATCHES_PER_COMMIT = 20
+
+# Настройки соединения на время загрузки: журнал в памяти, без fsync
+LOAD_PRAGMAS = (
+    ('journal_mode', 'MEMORY'),
+    ('synchronous', 'OFF'),
+    ('cache_size', '-262144'),
+    ('temp_store', 'MEMORY'),
+    ('foreign_keys', 'OFF'),
+)
+
+# Таблицы, вторичные индексы и триггеры вставки которых удаляются на время загрузки
+BULK_TABLES = ('users', 'green_zones', 'zone_reports', 'maintenance_tasks', 'organizations')
+
+# Заполнение производных таблиц для строк с id >= ? одним запросом вместо
+# построчных триггеров вставки (те же выражения, что в триггерах миграций 4 и 8)
+DERIVED_FILLS = (
+    ('green_zones', '''
+        INSERT INTO zone_rtree (id, min_lon, max_lon, min_lat, max_lat)
+        SELECT id, lon, lon, lat, lat FROM green_zones
+        WHERE id >= ? AND lat IS NOT NULL AND lon IS NOT NULL
+    '''),
+    ('green_zones', '''
+        INSERT INTO zones_fts (rowid, name, location)
+        SELECT id, replace(replace(name, 'ё', 'е'), 'Ё', 'Е'), replace(replace(location, 'ё', 'е'), 'Ё', 'Е')
+        FROM green_zones WHERE id >= ?
+    '''),
+    ('zone_reports', '''
+        INSERT INTO report_notes_fts (rowid, notes)
+        SELECT id, replace(replace(notes, 'ё', 'е'), 'Ё', 'Е') FROM zone_reports
+        WHERE id >= ? AND notes IS NOT NULL AND notes != ''
+    '''),
+    ('organizations', '''
+        INSERT INTO organizations_fts (rowid, name, description)
+        SELECT id, replace(replace(name, 'ё', 'е'), 'Ё', 'Е'), replace(replace(description, 'ё', 'е'), 'Ё', 'Е')
+        FROM organizations WHERE id >= ?
+    '''),
+)
+
+
+class Timestamps:
+    """Случайные моменты за последние days дней в формате CURRENT_TIMESTAMP"""
+
+    def __init__(self, rng, days):
+        self.rng = rng
+        self.now = time.time()
+        self.span = days * 86400
+        self._days = {}
+
+    def format(self, moment):
+        day = int(moment // 86400)
+        prefix = self._days.get(day)
+        if prefix is None:
+            prefix = self._days[day] = time.strftime('%Y-%m-%d ', time.gmtime(day * 86400))
+        seconds = int(moment) - day * 86400
+        return f'{prefix}{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+    def growing(self):
+        """Момент создания: плотность растет к настоящему времени (платформа набирает пользователей)"""
+        return self.now - self.span * (1 - math.sqrt(self.rng.random()))
+
+    def activity(self, since):
+        """Момент активности после since: чаще летом и в дневные часы"""
+        rng = self.rng
+        while True:
+            moment = since + (self.now - since) * rng.random()
+            day_of_year = (moment / 86400) % 365.25
+            # Пик в середине июля, зимой активность примерно в 4 раза ниже
+            season = 0.6 + 0.4 * math.cos((day_of_year - 196) / 365.25 * 2 * math.pi)
+            if rng.random() < season:
+                break
+        # Время суток сдвигается в интервал 8-21 часов
+        day = moment - moment % 86400
+        return min(day + 8 * 3600 + rng.random() * 13 * 3600, self.now)
+
+
+def cumulative(weights):
+    total = 0.0
+    result = []
+    for weight in weights:
+        total += weight
+        result.append(total)
+    return result
+
+
+def max_id(conn, table):
+    return conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+
+
+def insert_batches(conn, sql, rows, total, label, batch_size):
+    """Вставить строки генератора rows пакетами с периодическим commit"""
+    started = time.time()
+    batch = []
+    done = 0
+    batches = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            conn.executemany(sql, batch)
+            done += len(batch)
+            batch = []
+            batches += 1
+            if batches % BATCHES_PER_COMMIT == 0:
+                conn.commit()
+                rate = done / max(time.time() - started, 0.001)
+                print(f"   {label}: {done:,} из {total:,} ({rate:,.0f} строк/с)")
+    if batch:
+        conn.executemany(sql, batch)
+        done += len(batch)
+    conn.commit()
+    elapsed = time.time() - started
+    print(f"✅ {label}: {done:,} за {elapsed:.1f} с ({done / max(elapsed, 0.001):,.0f} строк/с)")
+
+
+def drop_bulk_objects(conn):
+    """Удалить индексы и триггеры вставки таблиц BULK_TABLES; SQL для их восстановления"""
+    placeholders = ','.join('?' * len(BULK_TABLES))
+    objects = conn.execute(f'''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE tbl_name IN ({placeholders}) AND sql IS NOT NULL
+          AND (type = 'index' OR (type = 'trigger' AND sql LIKE '%AFTER INSERT%'))
+    ''', BULK_TABLES).fetchall()
+    for kind, name, _ in objects:
+        conn.execute(f'DROP {kind.upper()} {name}')
+    conn.commit()
+    return [sql for _, _, sql in objects]
+
+
+def fill_derived(conn, first_ids):
+    """Заполнить пространственный и полнотекстовые индексы для загруженных строк"""
+    for table, sql in DERIVED_FILLS:
+        conn.execute(sql, (first_ids[table],))
+    conn.commit()
+
+
+def generate_cities(conn, rng, args, stamps):
+    """Города с населением по Ципфу; список (id, name, lat, lon, bbox, вес) новых городов"""
+    first_id = max_id(conn, 'cities') + 1
+    existing = {row[0] for row in conn.execute('SELECT name FROM cities')}
+    populations = [int(1200000 / rank ** 1.05 * rng.lognormvariate(0, 0.25)) + 3000
+                   for rank in range(1, args.cities + 1)]
+
+    rows = []
+    for population in populations:
+        name = rng.choice(CITY_ROOTS) + rng.choice(CITY_SUFFIXES)
+        suffix = 2
+        base = name
+        while name in existing:
+            name = f'{base}-{suffix}'
+            suffix += 1
+        existing.add(name)
+        lat = rng.uniform(45.0, 68.0)
+        lon = rng.uniform(28.0, 135.0)
+        bbox = gazetteer.approximate_bbox(lat, lon, population)
+        rows.append((name, rng.choice(REGIONS), population, round(lat, 6), round(lon, 6), *bbox,
+                     stamps.format(stamps.now - stamps.span)))
+
+    insert_batches(conn, '''
+        INSERT INTO cities (name, region, population, lat, lon, min_lon, min_lat, max_lon, max_lat, created_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows, len(rows), 'Города', args.batch)
+
+    # Число зон и жителей-пользователей растет медленнее населения
+    return [(first_id + i, row[0], row[3], row[4], row[5:9], populations[i] ** 0.8) for i, row in enumerate(rows)]
+
+
+def generate_users(conn, rng, args, cities, city_cum):
+    """Пользователи, распределенные по городам как население; списки id по индексу города"""
+    first_id = max_id(conn, 'users') + 1
+    password_hash = database.hash_password('password')
+    city_indexes = rng.choices(range(len(cities)), cum_weights=city_cum, k=args.users)
+    by_city = [[] for _ in cities]
+
+    def rows():
+        for i, city_index in enumerate(city_indexes):
+            user_id = first_id + i
+            by_city[city_index].append(user_id)
+            # Примерно один администратор на 200 пользователей
+            role = 'admin' if rng.random() < 0.005 else 'user'
+            yield (f'bench_user_{user_id}', f'bench_user_{user_id}@example.com', password_hash,
+                   cities[city_index][1], role)
+
+    insert_batches(conn, 'INSERT INTO users (username, email, password_hash, city, role) VALUES (?, ?, ?, ?, ?)',
+                   rows(), args.users, 'Пользователи', args.batch)
+
+    # В маленьком городе может не оказаться пользователей: берем любого
+    all_users = range(first_id, first_id + args.users)
+    return [users or [rng.choice(all_users)] for users in by_city]
+
+
+def generate_organizations(conn, rng, args, cities, city_cum, users_by_city):
+    """Организации по городам; списки id по индексу города"""
+    first_id = max_id(conn, 'organizations') + 1
+    city_indexes = rng.choices(range(len(cities)), cum_weights=city_cum, k=args.organizations)
+    by_city = [[] for _ in cities]
+
+    def rows():
+        for i, city_index in enumerate(city_indexes):
+            by_city[city_index].append(first_id + i)
+            city_id, city_name = cities[city_index][0], cities[city_index][1]
+            yield (f'Организация {first_id + i} ({city_name})', rng.choice(ORG_TYPES),
+                   'Уход за зелеными зонами города', None, None, None, None, city_id,
+                   rng.choice(users_by_city[city_index]))
+
+    insert_batches(conn, '''
+        INSERT INTO organizations (name, org_type, description, contact_person, phone, email, website, city_id, created_by)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows(), args.organizations, 'Организации', args.batch)
+    return by_city
+
+
+def generate_zones(conn, rng, args, cities, city_cum, users_by_city, stamps):
+    """Зоны вокруг центров городов; параллельные списки свойств новых зон по их порядковому номеру"""
+    first_id = max_id(conn, 'green_zones') + 1
+    city_indexes = rng.choices(range(len(cities)), cum_weights=city_cum, k=args.zones)
+    created = [stamps.growing() for _ in range(args.zones)]
+    # Базовое состояние зоны: от него отсчитываются оценки в отчетах
+    quality = [min(max(rng.gauss(72, 14), 5), 100) for _ in range(args.zones)]
+
+    def rows():
+        for i, city_index in enumerate(city_indexes):
+            city_id, _, lat, lon, bbox, _ = cities[city_index]
+            type_index = rng.choices(range(len(ZONE_TYPES)), weights=ZONE_TYPE_WEIGHTS)[0]
+            # Зоны гуще у центра города
+            zone_lat = min(max(rng.gauss(lat, (bbox[3] - bbox[1]) / 4), bbox[1]), bbox[3])
+            zone_lon = min(max(rng.gauss(lon, (bbox[2] - bbox[0]) / 4), bbox[0]), bbox[2])
+            creator = rng.choice(users_by_city[city_index])
+            status = rng.choices(('approved', 'pending', 'rejected'), weights=(90, 7, 3))[0]
+            approved_date = stamps.format(created[i] + 86400 * rng.random()) if status == 'approved' else None
+            yield (city_id, f'{rng.choice(ZONE_NAME_PREFIXES)} {rng.choice(ZONE_NAME_SUBJECTS)} {first_id + i}',
+                   ZONE_TYPES[type_index], round(rng.expovariate(1 / ZONE_TYPE_AREA[type_index]), 2),
+                   f'ул. {rng.choice(STREETS)}, {rng.randint(1, 150)}', f'{zone_lat:.6f},{zone_lon:.6f}',
+                   round(zone_lat, 6), round(zone_lon, 6), creator, status,
+                   creator if status == 'approved' else None, approved_date, stamps.format(created[i]))
+
+    insert_batches(conn, '''
+        INSERT INTO green_zones (city_id, name, zone_type, area, location, coordinates, lat, lon, created_by,
+                                 status, approved_by, approved_date, created_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows(), args.zones, 'Зеленые зоны', args.batch)
+
+    return first_id, city_indexes, created, quality
+
+
+def generate_reports(conn, rng, args, cities, zones, users_by_city, stamps):
+    """Отчеты: популярные зоны получают на порядки больше отчетов, чем остальные"""
+    first_zone_id, city_indexes, created, quality = zones
+    # Популярность зоны - распределение Парето с тяжелым хвостом
+    zone_cum = cumulative(rng.paretovariate(1.5) for _ in city_indexes)
+    zone_range = range(len(city_indexes))
+
+    def rows():
+        # Самый объемный цикл генератора: методы и таблицы привязаны к локальным именам
+        random_, gauss, activity, format_ = rng.random, rng.gauss, stamps.activity, stamps.format
+        city_ids = [city[0] for city in cities]
+        notes_count = len(REPORT_NOTES)
+        remaining = args.reports
+        while remaining:
+            count = min(remaining, args.batch)
+            remaining -= count
+            for zone_index in rng.choices(zone_range, cum_weights=zone_cum, k=count):
+                city_index = city_indexes[zone_index]
+                score = int(min(max(gauss(quality[zone_index], 10), 0), 100))
+                poor = score < 50
+                notes = REPORT_NOTES[int(random_() * notes_count)] if random_() < REPORT_NOTES_SHARE else ''
+                users = users_by_city[city_index]
+                yield (first_zone_id + zone_index, city_ids[city_index], score,
+                       int(poor and random_() < 0.7), int(random_() < 0.3), int(random_() < 0.25),
+                       int(poor and random_() < 0.3), notes, users[int(random_() * len(users))],
+                       format_(activity(created[zone_index])))
+
+    insert_batches(conn, '''
+        INSERT INTO zone_reports (zone_id, city_id, health_score, needs_watering, needs_pruning, needs_cleaning,
+                                  needs_repair, notes, reporter_id, report_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows(), args.reports, 'Отчеты', args.batch)
+
+
+def generate_tasks(conn, rng, args, cities, zones, users_by_city, orgs_by_city, stamps):
+    """Задачи: чаще у зон в плохом состоянии, большинство уже выполнено"""
+    first_zone_id, city_indexes, created, quality = zones
+    zone_cum = cumulative(110 - zone_quality for zone_quality in quality)
+    zone_range = range(len(city_indexes))
+
+    def rows():
+        remaining = args.tasks
+        while remaining:
+            count = min(remaining, args.batch)
+            remaining -= count
+            for zone_index in rng.choices(zone_range, cum_weights=zone_cum, k=count):
+                city_index = city_indexes[zone_index]
+                status = rng.choices(TASK_STATUSES, weights=TASK_STATUS_WEIGHTS)[0]
+                created_at = stamps.activity(created[zone_index])
+                creator = rng.choice(users_by_city[city_index])
+                organizations = orgs_by_city[city_index]
+                organization = rng.choice(organizations) if organizations and rng.random() < 0.4 else None
+                completed_at = stamps.format(min(created_at + rng.expovariate(1 / (5 * 86400)), stamps.now)) \
+                    if status == 'completed' else None
+                priority = 'high' if quality[zone_index] < 40 and rng.random() < 0.6 else rng.choice(PRIORITIES)
+                yield (first_zone_id + zone_index, cities[city_index][0], rng.choice(TASK_TYPES), status, priority,
+                       'Плановые работы', creator, organization, stamps.format(created_at),
+                       stamps.format(created_at + 14 * 86400), completed_at,
+                       creator if status == 'completed' else None)
+
+    insert_batches(conn, '''
+        INSERT INTO maintenance_tasks (zone_id, city_id, task_type, status, priority, description, created_by,
+                                       assigned_organization, created_date, due_date, completed_date, completed_by)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows(), args.tasks, 'Задачи', args.batch)
+
+
+def generate(args):
+    """Создать (или дополнить) базу args.db синтетическими данными"""
+    if args.fresh and os.path.exists(args.db):
+        os.remove(args.db)
+    if not os.path.exists(args.db):
+        database.init_db(args.db)
+    migrations.migrate(args.db)
+
+    rng = random.Random(args.seed)
+    stamps = Timestamps(rng, args.days)
+    started = time.time()
+
+    conn = sqlite3.connect(args.db)
+    for name, value in LOAD_PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+
+    print("🗂️ Удаление индексов и триггеров вставки на время загрузки...")
+    first_ids = {table: max_id(conn, table) + 1 for table in BULK_TABLES}
+    restore_sql = drop_bulk_objects(conn)
+
+    try:
+        cities = generate_cities(conn, rng, args, stamps)
+        city_cum = cumulative(city[5] for city in cities)
+        users_by_city = generate_users(conn, rng, args, cities, city_cum)
+        orgs_by_city = generate_organizations(conn, rng, args, cities, city_cum, users_by_city)
+        zones = generate_zones(conn, rng, args, cities, city_cum, users_by_city, stamps)
+        generate_reports(conn, rng, args, cities, zones, users_by_city, stamps)
+        generate_tasks(conn, rng, args, cities, zones, users_by_city, orgs_by_city, stamps)
+    finally:
+        print("🗂️ Восстановление индексов и триггеров...")
+        fill_derived(conn, first_ids)
+        for sql in restore_sql:
+            conn.execute(sql)
+        conn.commit()
+
+    print("🔄 Пересчет агрегатов...")
+    database.backfill_zone_coordinates(conn)
+    gazetteer.backfill_city_coordinates(conn)
+    database.rebuild_zone_stats(conn)
+    database.rebuild_city_stats(conn)
+    database.rebuild_user_stats(conn)
+    for scope in ('cities', 'zones'):
+        database.bump_data_version(conn, scope)
+    conn.commit()
+
+    print("📈 Сбор статистики для планировщика (ANALYZE)...")
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.close()
+
+    print(f"✅ Данные сгенерированы за {time.time() - started:.0f} с: {args.db}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Генератор синтетических данных для нагрузочных тестов')
+    parser.add_argument('--db', default='green_city_bench.db', help='файл базы данных (по умолчанию %(default)s)')
+    parser.add_argument('--fresh', action='store_true', help='удалить файл базы перед генерацией')
+    parser.add_argument('--cities', type=int, default=1000)
+    parser.add_argument('--users', type=int, help='по умолчанию 50 на город')
+    parser.add_argument('--organizations', type=int, help='по умолчанию 3 на город')
+    parser.add_argument('--zones', type=int, default=500000)
+    parser.add_argument('--reports', type=int, default=20000000)
+    parser.add_argument('--tasks', type=int, default=2000000)
+    parser.add_argument('--days', type=int, default=3 * 365, help='период, за который генерируются даты')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch', type=int, default=DEFAULT_BATCH, help='строк в одном executemany')
+    args = parser.parse_args(argv)
+    if args.users is None:
+        args.users = args.cities * 50
+    if args.organizations is None:
+        args.organizations = args.cities * 3
+    return args
+
+
+if __name__ == '__main__':
+    generate(parse_args())
@@ -0,0 +1,247 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import database
+import metrics
+import ratelimit
+
+# Сколько хранить найденный результат и отрицательный ответ ("ничего не найдено")
+GEOCODE_TTL = 30 * 24 * 3600
+GEOCODE_NEGATIVE_TTL = 24 * 3600
+
+# Размер LRU в памяти воркера
+GEOCODE_MEMORY_ENTRIES = 2048
+
+# Точность округления координат для ключа (4 знака - около 11 метров)
+COORDINATE_PRECISION = 4
+
+# Раз в столько записей из таблицы удаляются просроченные строки
+PRUNE_INTERVAL = 100
+
+# Через сколько секунд захват ключа считается брошенным (дольше таймаута запроса к сервису)
+CLAIM_TIMEOUT = 15
+# Сколько воркер ждет результата чужого захвата, прежде чем ответить 429, и как часто
+# проверяет кэш; ожидание только читает таблицу и не берет блокировку записи
+CLAIM_WAIT = 2
+CLAIM_POLL_INTERVAL = 0.1
+
+
+class LRUCache:
+    """Потокобезопасный LRU со сроком жизни записей"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(True, значение) для живой записи, иначе (False, None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SingleFlight:
+    """Объединяет одновременные вызовы с одинаковым ключом в один вызов"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """Результат fn(); если вызов с key уже идет в другом потоке - дождаться его результата.
+
+        Если результата нет за timeout секунд (например, поток-лидер завис), выбрасывает TimeoutError.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event(), 'value': None, 'error': None}
+
+        if not leader:
+            if not call['done'].wait(timeout):
+                raise TimeoutError(f'Call "{key}" did not finish in {timeout}s')
+            if call['error'] is not None:
+                raise call['error']
+            return call['value']
+
+        try:
+            call['value'] = fn()
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+        return call['value']
+
+
+_memory = LRUCache(GEOCODE_MEMORY_ENTRIES)
+_flights = SingleFlight()
+_writes = {'count': 0}
+
+
+def normalize_query(text):
+    """Ключ для текстового запроса: регистр, ё/е и лишние пробелы не важны"""
+    return ' '.join(str(text).casefold().replace('ё', 'е').split())
+
+
+def coordinate_key(lat, lon):
+    """Ключ для координат, округленных до COORDINATE_PRECISION знаков"""
+    return f'{round(float(lat), COORDINATE_PRECISION)},{round(float(lon), COORDINATE_PRECISION)}'
+
+
+def _load(key):
+    conn = database.get_db_connection()
+    row = conn.execute(
+        'SELECT value, expires_at FROM geocode_cache WHERE key = ? AND expires_at > ?',
+        (key, time.time())
+    ).fetchone()
+    conn.close()
+    if row is None:
+        return False, None, None
+    value = json.loads(row['value']) if row['value'] is not None else None
+    return True, value, row['expires_at']
+
+
+def _claim(key):
+    """Захватить ключ для запроса к сервису; False, если его уже запрашивает другой воркер"""
+    # Отдельное соединение из пула: транзакция запроса не должна смешиваться с BEGIN IMMEDIATE
+    conn = database.get_pool().acquire()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        now = time.time()
+        row = conn.execute('SELECT claimed_until FROM geocode_claims WHERE key = ?', (key,)).fetchone()
+        claimed = row is None or row['claimed_until'] <= now
+        if claimed:
+            conn.execute(
+                'INSERT OR REPLACE INTO geocode_claims (key, claimed_until) VALUES (?, ?)',
+                (key, now + CLAIM_TIMEOUT)
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return claimed
+
+
+def _release(key):
+    """Снять захват без результата (fetch() упал), чтобы ключ мог запросить другой воркер"""
+    conn = database.get_pool().acquire()
+    try:
+        conn.execute('DELETE FROM geocode_claims WHERE key = ?', (key,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _store(key, value, expires_at):
+    """Записать результат и снять захват ключа в одной транзакции"""
+    conn = database.get_pool().acquire()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute(
+            'INSERT OR REPLACE INTO geocode_cache (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value, ensure_ascii=False) if value is not None else None, expires_at)
+        )
+        conn.execute('DELETE FROM geocode_claims WHERE key = ?', (key,))
+        _writes['count'] += 1
+        if _writes['count'] % PRUNE_INTERVAL == 0:
+            now = time.time()
+            conn.execute('DELETE FROM geocode_cache WHERE expires_at <= ?', (now,))
+            conn.execute('DELETE FROM geocode_claims WHERE claimed_until <= ?', (now,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def cached(kind, key, fetch):
+    """Результат геокодирования из кэша или от fetch().
+
+    fetch() возвращает результат или None, если ничего не найдено (кэшируется на
+    GEOCODE_NEGATIVE_TTL); исключение из fetch() (сеть, ошибка сервиса, лимит запросов)
+    не кэшируется. Одновременные промахи по одному ключу делят один вызов fetch():
+    потоки воркера - через SingleFlight, воркеры - через захват в таблице geocode_claims.
+    Если ключ запрашивает другой воркер и результата нет за CLAIM_WAIT секунд,
+    выбрасывается ratelimit.RateLimited (в приложении - ответ 429 с Retry-After).
+    """
+    full_key = f'{kind}:{key}'
+
+    hit, value = _memory.get(full_key)
+    metrics.record_cache('geocode_memory', hit)
+    if hit:
+        return value
+
+    try:
+        return _flights.do(full_key, lambda: _fill(full_key, fetch), timeout=CLAIM_TIMEOUT)
+    except TimeoutError:
+        raise ratelimit.RateLimited('geocode', CLAIM_WAIT)
+
+
+def _fill(full_key, fetch):
+    # Пока ждали своей очереди, ключ мог заполнить другой воркер
+    hit, value, expires_at = _load(full_key)
+    metrics.record_cache('geocode_db', hit)
+    if hit:
+        _memory.set(full_key, value, expires_at)
+        return value
+
+    # Ключ запрашивает другой воркер: недолго ждем его результата, читая кэш, а затем
+    # отвечаем 429 - клиент повторит запрос, когда результат уже будет в кэше.
+    # Если тот воркер упал, его захват истечет через CLAIM_TIMEOUT и перейдет к другому
+    if not _claim(full_key):
+        deadline = time.monotonic() + CLAIM_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(CLAIM_POLL_INTERVAL)
+            hit, value, expires_at = _load(full_key)
+            if hit:
+                _memory.set(full_key, value, expires_at)
+                return value
+        raise ratelimit.RateLimited('geocode', CLAIM_WAIT)
+
+    try:
+        value = fetch()
+    except Exception:
+        _release(full_key)
+        raise
+    expires_at = time.time() + (GEOCODE_TTL if value is not None else GEOCODE_NEGATIVE_TTL)
+    _store(full_key, value, expires_at)
+    _memory.set(full_key, value, expires_at)
+    return value
+
+
+def clear():
+    """Очистить кэш в памяти и в БД"""
+    _memory.clear()
+    conn = database.get_db_connection()
+    conn.execute('DELETE FROM geocode_cache')
+    conn.execute('DELETE FROM geocode_claims')
+    conn.commit()
+    conn.close()
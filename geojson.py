@@ -0,0 +1,40 @@
+import json
+
+# Знаков после запятой в координатах: 5 знаков - около 1 метра
+DEFAULT_PRECISION = 5
+MAX_PRECISION = 7
+
+MIMETYPE = 'application/geo+json'
+
+
+def feature(zone, precision=DEFAULT_PRECISION, properties=None):
+    """Зона (словарь из API) как GeoJSON Feature с точкой [lon, lat]"""
+    geometry = None
+    if zone.get('lat') is not None and zone.get('lon') is not None:
+        geometry = {
+            'type': 'Point',
+            'coordinates': [round(zone['lon'], precision), round(zone['lat'], precision)]
+        }
+
+    if properties is None:
+        properties = [key for key in zone if key not in ('id', 'lat', 'lon', 'coordinates')]
+
+    return {
+        'type': 'Feature',
+        'id': zone['id'],
+        'geometry': geometry,
+        'properties': {key: zone[key] for key in properties}
+    }
+
+
+def feature_collection(zones, precision=DEFAULT_PRECISION, properties=None):
+    """GeoJSON FeatureCollection для списка зон"""
+    return {
+        'type': 'FeatureCollection',
+        'features': [feature(zone, precision, properties) for zone in zones]
+    }
+
+
+def dumps(data):
+    """Компактная сериализация: без пробелов и без \\u-экранирования кириллицы"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
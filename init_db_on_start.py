@@ -1,5 +1,6 @@
 import os
 import database
+import migrations
 import add_test_zones
 
 
@@ -13,6 +14,7 @@ def init_on_render():
 
     # Инициализируем новую базу
     database.init_db()
+    migrations.migrate()
 
     # Добавляем тестовые зоны
     print("📝 Добавление тестовых зон...")
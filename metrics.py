@@ -0,0 +1,203 @@
+"""Метрики приложения в текстовом формате Prometheus (/metrics).
+
+Метрики хранятся в памяти процесса: под gunicorn каждый воркер отдает свои
+значения, поэтому Prometheus должен опрашивать воркеры по отдельности или
+суммировать их по меткам instance/pid.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, abort, g, has_request_context, request
+
+import database
+
+# Границы корзин по умолчанию (секунды), как в клиентских библиотеках Prometheus
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Если задан, /metrics отдается только с заголовком Authorization: Bearer <токен>
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонно растущий счетчик с метками"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    """Гистограмма с накопительными корзинами, суммой и числом наблюдений"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # метки -> [счетчики по корзинам (последняя - +Inf), сумма]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for label_values, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, [('le', _format_value(float(bound)))])
+                yield self.name + '_bucket', labels, cumulative
+            labels = _format_labels(self.labels, label_values)
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, cumulative
+
+
+class Registry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    'http_requests_total', 'Обработанные HTTP-запросы', ('route', 'method', 'status')))
+http_duration = registry.register(Histogram(
+    'http_request_duration_seconds', 'Время обработки запроса до отдачи ответа', ('route', 'method')))
+db_queries_per_request = registry.register(Histogram(
+    'db_queries_per_request', 'Число SQL-запросов за HTTP-запрос', ('route',), COUNT_BUCKETS))
+db_time_per_request = registry.register(Histogram(
+    'db_query_seconds_per_request', 'Суммарное время SQL за HTTP-запрос', ('route',)))
+db_query_duration = registry.register(Histogram(
+    'db_query_duration_seconds', 'Время выполнения одного SQL-запроса', ('route', 'operation'), QUERY_BUCKETS))
+cache_requests = registry.register(Counter(
+    'cache_requests_total', 'Обращения к кэшам: hit / miss', ('cache', 'result')))
+geocoder_duration = registry.register(Histogram(
+    'geocoder_request_duration_seconds', 'Время HTTP-запроса к геокодеру', ('endpoint',)))
+geocoder_errors = registry.register(Counter(
+    'geocoder_errors_total', 'Ошибки геокодирования', ('operation',)))
+
+
+def route_label():
+    """Метка маршрута: имя endpoint Flask (ограниченное множество значений)"""
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return 'none'
+
+
+def record_cache(cache, hit):
+    """Учесть попадание или промах кэша"""
+    cache_requests.inc(cache, 'hit' if hit else 'miss')
+
+
+def _operation(sql):
+    words = sql.split(None, 1)
+    return words[0].upper() if words else 'OTHER'
+
+
+def _on_query(sql, parameters, seconds):
+    route = route_label()
+    db_query_duration.observe(seconds, route, _operation(sql))
+    if has_request_context():
+        g._sql_count = g.get('_sql_count', 0) + 1
+        g._sql_seconds = g.get('_sql_seconds', 0.0) + seconds
+
+
+def _start_timer():
+    g._request_started = time.perf_counter()
+    g._sql_count = 0
+    g._sql_seconds = 0.0
+
+
+def _record_request(response):
+    started = g.pop('_request_started', None)
+    if started is None:
+        return response
+    route = route_label()
+    http_duration.observe(time.perf_counter() - started, route, request.method)
+    http_requests.inc(route, request.method, str(response.status_code))
+    db_queries_per_request.observe(g.get('_sql_count', 0), route)
+    db_time_per_request.observe(g.get('_sql_seconds', 0.0), route)
+    return response
+
+
+def metrics_view():
+    """Метрики процесса в формате Prometheus"""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        abort(403)
+    return Response(registry.expose(), mimetype=None, content_type=CONTENT_TYPE)
+
+
+def init_app(app):
+    """Подключить сбор метрик к приложению и к соединениям БД, добавить /metrics"""
+    database.add_query_listener(_on_query)
+    # before_request регистрируется первым, чтобы время включало остальные обработчики
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,387 @@
+import sqlite3
+import sys
+
+import database
+import gazetteer
+
+
+def _run_script(conn, script):
+    """Выполнить SQL-скрипт по одному оператору внутри текущей транзакции"""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        # complete_statement корректно обрабатывает тела триггеров с ';'
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+    if statement.strip():
+        conn.execute(statement)
+
+
+# Индексы под реальные WHERE/JOIN/ORDER BY из app.py, auth.py и database.py
+INDEXES_V1 = '''
+    -- Карта, API и статистика города: WHERE city_id = ? AND status = 'approved'
+    CREATE INDEX IF NOT EXISTS idx_green_zones_city_status ON green_zones (city_id, status);
+    -- Модерация: WHERE status = 'pending' ORDER BY created_date DESC
+    CREATE INDEX IF NOT EXISTS idx_green_zones_status_created ON green_zones (status, created_date);
+    -- Действия пользователя: WHERE created_by = ? ORDER BY created_date DESC
+    CREATE INDEX IF NOT EXISTS idx_green_zones_created_by ON green_zones (created_by, created_date);
+
+    -- Страница зоны и агрегаты по зоне: WHERE zone_id = ? ORDER BY report_date DESC
+    CREATE INDEX IF NOT EXISTS idx_zone_reports_zone_date ON zone_reports (zone_id, report_date);
+    -- Отчеты по городу: WHERE city_id = ? GROUP BY категория health_score
+    CREATE INDEX IF NOT EXISTS idx_zone_reports_city_health ON zone_reports (city_id, health_score);
+    -- Профиль: WHERE reporter_id = ? ORDER BY report_date DESC
+    CREATE INDEX IF NOT EXISTS idx_zone_reports_reporter ON zone_reports (reporter_id, report_date);
+
+    -- Задачи зоны и подсчет pending-задач: WHERE zone_id = ? [AND status = ...]
+    CREATE INDEX IF NOT EXISTS idx_maintenance_tasks_zone_status ON maintenance_tasks (zone_id, status);
+    -- Отчеты по городу: WHERE city_id = ? GROUP BY task_type, status
+    CREATE INDEX IF NOT EXISTS idx_maintenance_tasks_city_type_status ON maintenance_tasks (city_id, task_type, status);
+    -- Общая статистика: WHERE status = 'pending' [AND priority = 'high']
+    CREATE INDEX IF NOT EXISTS idx_maintenance_tasks_status_priority ON maintenance_tasks (status, priority);
+    -- Подтверждение: WHERE status = 'verification_requested' ORDER BY verification_requested_date DESC
+    CREATE INDEX IF NOT EXISTS idx_maintenance_tasks_status_verification
+        ON maintenance_tasks (status, verification_requested_date);
+    -- Последние задачи на главной: ORDER BY created_date DESC LIMIT 5
+    CREATE INDEX IF NOT EXISTS idx_maintenance_tasks_created_date ON maintenance_tasks (created_date);
+    -- Профиль: WHERE created_by = ?
+    CREATE INDEX IF NOT EXISTS idx_maintenance_tasks_created_by ON maintenance_tasks (created_by);
+
+    -- Удаление города: WHERE city = ?
+    CREATE INDEX IF NOT EXISTS idx_users_city ON users (city);
+
+    -- Организации города: WHERE city_id = ? AND is_active = 1 ORDER BY name
+    CREATE INDEX IF NOT EXISTS idx_organizations_city_name ON organizations (city_id, name);
+
+    ANALYZE;
+'''
+
+
+ZONE_STATS_V2 = '''
+    CREATE TABLE IF NOT EXISTS zone_stats (
+        zone_id INTEGER PRIMARY KEY,
+        city_id INTEGER,
+        report_count INTEGER NOT NULL DEFAULT 0,
+        health_count INTEGER NOT NULL DEFAULT 0,
+        health_sum INTEGER NOT NULL DEFAULT 0,
+        last_report_date TIMESTAMP,
+        pending_tasks INTEGER NOT NULL DEFAULT 0,
+        critical_tasks INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (zone_id) REFERENCES green_zones (id),
+        FOREIGN KEY (city_id) REFERENCES cities (id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_zone_stats_city ON zone_stats (city_id);
+'''
+
+
+def zone_stats_v2(conn):
+    """Таблица агрегатов по зонам и ее первоначальное заполнение"""
+    _run_script(conn, ZONE_STATS_V2)
+    database.rebuild_zone_stats(conn)
+
+
+DATA_VERSIONS_V3 = '''
+    -- Версии данных для инвалидации кэшей во всех воркерах
+    CREATE TABLE IF NOT EXISTS data_versions (
+        scope TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+'''
+
+
+ZONE_COORDINATES_V4 = '''
+    ALTER TABLE green_zones ADD COLUMN lat REAL;
+    ALTER TABLE green_zones ADD COLUMN lon REAL;
+
+    -- Пространственный индекс по точкам зон
+    CREATE VIRTUAL TABLE IF NOT EXISTS zone_rtree USING rtree (id, min_lon, max_lon, min_lat, max_lat);
+
+    CREATE TRIGGER IF NOT EXISTS green_zones_rtree_insert AFTER INSERT ON green_zones
+    WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL
+    BEGIN
+        INSERT INTO zone_rtree (id, min_lon, max_lon, min_lat, max_lat)
+        VALUES (new.id, new.lon, new.lon, new.lat, new.lat);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS green_zones_rtree_update AFTER UPDATE OF lat, lon ON green_zones
+    BEGIN
+        DELETE FROM zone_rtree WHERE id = old.id;
+        INSERT INTO zone_rtree (id, min_lon, max_lon, min_lat, max_lat)
+        SELECT new.id, new.lon, new.lon, new.lat, new.lat
+        WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS green_zones_rtree_delete AFTER DELETE ON green_zones
+    BEGIN
+        DELETE FROM zone_rtree WHERE id = old.id;
+    END;
+'''
+
+
+def zone_coordinates_v4(conn):
+    """Числовые координаты зон, R*Tree-индекс и перенос старых строковых координат"""
+    _run_script(conn, ZONE_COORDINATES_V4)
+    database.backfill_zone_coordinates(conn)
+
+
+GEOCODE_CACHE_V5 = '''
+    -- Кэш геокодирования: value = NULL означает "ничего не найдено"
+    CREATE TABLE IF NOT EXISTS geocode_cache (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        expires_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_geocode_cache_expires ON geocode_cache (expires_at);
+'''
+
+
+RATE_LIMITS_V6 = '''
+    -- Ведра токенов, общие для всех воркеров (лимит запросов к внешним сервисам)
+    CREATE TABLE IF NOT EXISTS rate_limits (
+        name TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+'''
+
+
+CITY_COORDINATES_V7 = '''
+    -- Центр и границы города (справочник вместо запросов к Nominatim)
+    ALTER TABLE cities ADD COLUMN lat REAL;
+    ALTER TABLE cities ADD COLUMN lon REAL;
+    ALTER TABLE cities ADD COLUMN min_lon REAL;
+    ALTER TABLE cities ADD COLUMN min_lat REAL;
+    ALTER TABLE cities ADD COLUMN max_lon REAL;
+    ALTER TABLE cities ADD COLUMN max_lat REAL;
+'''
+
+
+def city_coordinates_v7(conn):
+    """Координаты городов и их заполнение из встроенного справочника"""
+    _run_script(conn, CITY_COORDINATES_V7)
+    gazetteer.backfill_city_coordinates(conn)
+    database.bump_data_version(conn, 'cities')
+
+
+# Полнотекстовый поиск. Таблицы FTS5 хранят собственную копию текста с ё -> е
+# (токенизатор unicode61 их не отождествляет) и синхронизируются триггерами
+FULLTEXT_V8 = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS zones_fts USING fts5 (
+        name, location, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS report_notes_fts USING fts5 (
+        notes, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS organizations_fts USING fts5 (
+        name, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS green_zones_fts_insert AFTER INSERT ON green_zones
+    BEGIN
+        INSERT INTO zones_fts (rowid, name, location) VALUES (
+            new.id,
+            replace(replace(new.name, 'ё', 'е'), 'Ё', 'Е'),
+            replace(replace(new.location, 'ё', 'е'), 'Ё', 'Е')
+        );
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS green_zones_fts_update AFTER UPDATE OF name, location ON green_zones
+    BEGIN
+        DELETE FROM zones_fts WHERE rowid = old.id;
+        INSERT INTO zones_fts (rowid, name, location) VALUES (
+            new.id,
+            replace(replace(new.name, 'ё', 'е'), 'Ё', 'Е'),
+            replace(replace(new.location, 'ё', 'е'), 'Ё', 'Е')
+        );
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS green_zones_fts_delete AFTER DELETE ON green_zones
+    BEGIN
+        DELETE FROM zones_fts WHERE rowid = old.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS zone_reports_fts_insert AFTER INSERT ON zone_reports
+    WHEN new.notes IS NOT NULL AND new.notes != ''
+    BEGIN
+        INSERT INTO report_notes_fts (rowid, notes)
+        VALUES (new.id, replace(replace(new.notes, 'ё', 'е'), 'Ё', 'Е'));
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS zone_reports_fts_update AFTER UPDATE OF notes ON zone_reports
+    BEGIN
+        DELETE FROM report_notes_fts WHERE rowid = old.id;
+        INSERT INTO report_notes_fts (rowid, notes)
+        SELECT new.id, replace(replace(new.notes, 'ё', 'е'), 'Ё', 'Е')
+        WHERE new.notes IS NOT NULL AND new.notes != '';
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS zone_reports_fts_delete AFTER DELETE ON zone_reports
+    BEGIN
+        DELETE FROM report_notes_fts WHERE rowid = old.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS organizations_fts_insert AFTER INSERT ON organizations
+    BEGIN
+        INSERT INTO organizations_fts (rowid, name, description) VALUES (
+            new.id,
+            replace(replace(new.name, 'ё', 'е'), 'Ё', 'Е'),
+            replace(replace(new.description, 'ё', 'е'), 'Ё', 'Е')
+        );
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS organizations_fts_update AFTER UPDATE OF name, description ON organizations
+    BEGIN
+        DELETE FROM organizations_fts WHERE rowid = old.id;
+        INSERT INTO organizations_fts (rowid, name, description) VALUES (
+            new.id,
+            replace(replace(new.name, 'ё', 'е'), 'Ё', 'Е'),
+            replace(replace(new.description, 'ё', 'е'), 'Ё', 'Е')
+        );
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS organizations_fts_delete AFTER DELETE ON organizations
+    BEGIN
+        DELETE FROM organizations_fts WHERE rowid = old.id;
+    END;
+
+    -- Индексация уже существующих данных
+    INSERT INTO zones_fts (rowid, name, location)
+    SELECT id, replace(replace(name, 'ё', 'е'), 'Ё', 'Е'), replace(replace(location, 'ё', 'е'), 'Ё', 'Е')
+    FROM green_zones;
+
+    INSERT INTO report_notes_fts (rowid, notes)
+    SELECT id, replace(replace(notes, 'ё', 'е'), 'Ё', 'Е')
+    FROM zone_reports WHERE notes IS NOT NULL AND notes != '';
+
+    INSERT INTO organizations_fts (rowid, name, description)
+    SELECT id, replace(replace(name, 'ё', 'е'), 'Ё', 'Е'), replace(replace(description, 'ё', 'е'), 'Ё', 'Е')
+    FROM organizations;
+'''
+
+
+CITY_STATS_V9 = '''
+    CREATE TABLE IF NOT EXISTS city_stats (
+        city_id INTEGER PRIMARY KEY,
+        total_zones INTEGER NOT NULL DEFAULT 0,
+        pending_tasks INTEGER NOT NULL DEFAULT 0,
+        critical_tasks INTEGER NOT NULL DEFAULT 0,
+        health_count INTEGER NOT NULL DEFAULT 0,
+        health_sum INTEGER NOT NULL DEFAULT 0,
+        total_organizations INTEGER NOT NULL DEFAULT 0
+    );
+'''
+
+
+def city_stats_v9(conn):
+    """Сводка по городам для главной страницы и ее первоначальное заполнение"""
+    _run_script(conn, CITY_STATS_V9)
+    database.rebuild_city_stats(conn)
+
+
+USER_STATS_V10 = '''
+    CREATE TABLE IF NOT EXISTS user_stats (
+        user_id INTEGER PRIMARY KEY,
+        zones_added INTEGER NOT NULL DEFAULT 0,
+        reports_submitted INTEGER NOT NULL DEFAULT 0,
+        tasks_created INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    );
+'''
+
+
+def user_stats_v10(conn):
+    """Счетчики активности пользователей и их первоначальное заполнение"""
+    _run_script(conn, USER_STATS_V10)
+    database.rebuild_user_stats(conn)
+
+
+# Случайный идентификатор экземпляра базы: при пересоздании базы (на Render она
+# живет в /tmp) версии данных начинаются заново, а идентификатор меняется
+DATABASE_INSTANCE_V11 = '''
+    INSERT OR IGNORE INTO data_versions (scope, version) VALUES ('instance', abs(random()) % 1000000000000);
+'''
+
+
+GEOCODE_CLAIMS_V12 = '''
+    -- Ключи геокодирования, которые сейчас запрашивает один из воркеров
+    CREATE TABLE IF NOT EXISTS geocode_claims (
+        key TEXT PRIMARY KEY,
+        claimed_until REAL NOT NULL
+    );
+'''
+
+
+# Упорядоченный список миграций: (версия, описание, SQL-скрипт или функция от соединения)
+MIGRATIONS = [
+    (1, 'Индексы по внешним ключам и полям фильтрации', INDEXES_V1),
+    (2, 'Агрегаты по зонам (zone_stats)', zone_stats_v2),
+    (3, 'Версии данных для кэшей (data_versions)', DATA_VERSIONS_V3),
+    (4, 'Числовые координаты зон и пространственный индекс', zone_coordinates_v4),
+    (5, 'Кэш геокодирования', GEOCODE_CACHE_V5),
+    (6, 'Лимиты запросов к внешним сервисам', RATE_LIMITS_V6),
+    (7, 'Центры и границы городов', city_coordinates_v7),
+    (8, 'Полнотекстовый поиск (FTS5)', FULLTEXT_V8),
+    (9, 'Сводка по городам (city_stats)', city_stats_v9),
+    (10, 'Счетчики активности пользователей (user_stats)', user_stats_v10),
+    (11, 'Идентификатор экземпляра базы данных', DATABASE_INSTANCE_V11),
+    (12, 'Захваты ключей геокодирования между воркерами', GEOCODE_CLAIMS_V12),
+]
+
+
+def get_schema_version(conn):
+    """Текущая версия схемы"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(db_path=None):
+    """Применить все непримененные миграции к базе данных"""
+    conn = sqlite3.connect(db_path or database.get_db_path(), isolation_level=None)
+    conn.execute('PRAGMA busy_timeout = 30000')
+    applied = 0
+
+    try:
+        current = get_schema_version(conn)
+        for version, description, step in MIGRATIONS:
+            if version <= current:
+                continue
+
+            # BEGIN IMMEDIATE сериализует миграции между воркерами gunicorn
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if get_schema_version(conn) >= version:
+                    conn.execute('ROLLBACK')
+                    continue
+                if callable(step):
+                    step(conn)
+                else:
+                    _run_script(conn, step)
+                conn.execute(
+                    'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                    (version, description)
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+            applied += 1
+            print(f"✅ Миграция {version} применена: {description}")
+    finally:
+        conn.close()
+
+    return applied
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    count = migrate(path)
+    print(f"📊 Применено миграций: {count}")
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import make_response, request, session
+
+import database
+import metrics
+import profiler
+from geocache import LRUCache
+
+# Сколько ответов держать в памяти воркера и как долго
+PAGE_CACHE_ENTRIES = 512
+PAGE_CACHE_TTL = 300
+# Большие ответы (например, все зоны страны) в кэш не кладутся
+PAGE_CACHE_MAX_BODY = 2 * 1024 * 1024
+
+# Заголовки, которые сохраняются вместе с телом ответа
+_KEPT_HEADERS = ('Content-Type', 'Link')
+
+_pages = LRUCache(PAGE_CACHE_ENTRIES)
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_deploy = {'code': None, 'db_path': None, 'token': None}
+# Время запуска воркера: Last-Modified не может быть раньше выкладки текущего кода
+_STARTED = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def _code_fingerprint():
+    """Хэш исходного кода и шаблонов приложения"""
+    digest = hashlib.sha1()
+    paths = [os.path.join(_APP_DIR, name) for name in os.listdir(_APP_DIR) if name.endswith('.py')]
+    for root, _, files in os.walk(os.path.join(_APP_DIR, 'templates')):
+        paths += [os.path.join(root, name) for name in files]
+    for path in sorted(paths):
+        digest.update(os.path.relpath(path, _APP_DIR).encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def deploy_token():
+    """Отпечаток развертывания для ETag: код и шаблоны плюс экземпляр базы данных.
+
+    Без него после выкладки с новыми шаблонами браузер получил бы 304 на старый
+    ETag, а пересозданная база с теми же номерами версий повторила бы старые ETag.
+    """
+    if _deploy['code'] is None:
+        _deploy['code'] = _code_fingerprint()
+    db_path = database.get_db_path()
+    if _deploy['db_path'] != db_path:
+        _deploy['token'] = f"{_deploy['code']}.{database.get_data_version('instance')}"
+        _deploy['db_path'] = db_path
+    return _deploy['token']
+
+
+def role_bucket():
+    """Группа посетителей, которым показываются одинаковые данные"""
+    if 'user_id' not in session:
+        return 'anonymous'
+    if session.get('role') in ['admin', 'creator']:
+        return 'moderator'
+    return 'user'
+
+
+def _cache_key(per_user):
+    """Ключ ответа: (адрес, город, группа[, пользователь и счетчики модерации])"""
+    bucket = role_bucket()
+    key = [request.full_path, session.get('city'), bucket]
+    if per_user and bucket != 'anonymous':
+        # В шапке страницы имя и роль пользователя, у модераторов - счетчики модерации
+        key += [session.get('user_id'), session.get('username')]
+        if bucket == 'moderator':
+            counters = database.get_moderation_counters()
+            key += [counters['pending_zones'], counters['tasks_awaiting_verification']]
+    return tuple(key)
+
+
+def cached_response(per_user=True):
+    """Кэш ответов GET-представления по (адрес, город, группа), с ETag и Last-Modified.
+
+    Ответ действителен, пока не изменилась версия данных города (ее увеличивают
+    все записи в зоны, отчеты, задачи и организации), справочник городов и
+    развертывание (deploy_token).
+    per_user - в ответе есть данные пользователя (шапка страницы), поэтому для
+    авторизованных ключ дополнительно включает пользователя.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Страница с flash-сообщениями показывается один раз и не кэшируется;
+            # профилируемый запрос всегда выполняет само представление
+            if request.method != 'GET' or '_flashes' in session or profiler.requested():
+                return view(*args, **kwargs)
+
+            version, updated = database.get_city_data_stamp(session.get('city'))
+            stamp = (deploy_token(), version, database.get_cities_version())
+            key = _cache_key(per_user)
+            etag = hashlib.sha1(repr((key, stamp)).encode('utf-8')).hexdigest()[:20]
+
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+            else:
+                hit, entry = _pages.get(key)
+                hit = hit and entry[0] == stamp
+                metrics.record_cache('pages', hit)
+                if hit:
+                    response = make_response(entry[1], 200, entry[2])
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    if (not response.is_streamed and '_flashes' not in session
+                            and 'X-Profile-Id' not in response.headers
+                            and response.content_length <= PAGE_CACHE_MAX_BODY):
+                        headers = {name: response.headers[name] for name in _KEPT_HEADERS if name in response.headers}
+                        _pages.set(key, (stamp, response.get_data(), headers), time.time() + PAGE_CACHE_TTL)
+
+            response.set_etag(etag)
+            response.last_modified = max(updated, _STARTED) if updated else _STARTED
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            if response.status_code == 200:
+                response.make_conditional(request)
+            return response
+        return wrapper
+    return decorator
+
+
+def clear():
+    """Очистить кэш ответов воркера"""
+    _pages.clear()
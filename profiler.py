@@ -0,0 +1,200 @@
+"""Профилирование отдельных запросов по требованию администратора.
+
+Администратор добавляет к адресу ?__profile=1 (или заголовок X-Profile: 1),
+и запрос выполняется под sys.setprofile: для каждого стека вызовов (функции
+Python, встроенные функции, шаблоны Jinja) накапливается собственное время.
+Результат сохраняется в PROFILE_DIR в формате collapsed stacks
+("a;b;c микросекунды" на строку), который понимают flamegraph.pl и speedscope,
+и показывается как flame graph на странице /admin/profiles.
+
+Профилируется код до after_request: тело потокового ответа не учитывается.
+"""
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, request, session
+
+import database
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(os.path.dirname(database.get_db_path()), 'profiles')
+# Сколько последних снимков хранить
+PROFILE_KEEP = 100
+# Узлы меньше этой доли общего времени на flame graph не показываются
+FLAME_MIN_SHARE = 0.002
+
+_NAME_RE = re.compile(r'^[0-9A-Za-z_.-]+$')
+
+
+def _frame_label(code):
+    # Последние два элемента пути, чтобы различать, например, app.py приложения и flask/app.py
+    filename = os.path.join(os.path.basename(os.path.dirname(code.co_filename)), os.path.basename(code.co_filename))
+    # co_qualname есть только с Python 3.11
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{name} ({filename}:{code.co_firstlineno})'.replace(';', ',')
+
+
+def _builtin_label(function):
+    name = getattr(function, '__qualname__', None) or repr(function)
+    module = getattr(function, '__module__', None) or 'builtins'
+    return f'{module}.{name}'.replace(';', ',')
+
+
+class StackProfiler:
+    """Точный профиль текущего потока: собственное время каждого стека вызовов"""
+
+    def __init__(self):
+        # Стек ключей: каждый ключ - кортеж меток от корня до функции
+        self._keys = [()]
+        self._last = 0.0
+        self.stacks = {}
+
+    def _profile(self, frame, event, arg):
+        now = time.perf_counter()
+        key = self._keys[-1]
+        if key:
+            self.stacks[key] = self.stacks.get(key, 0.0) + now - self._last
+
+        if event == 'call':
+            self._keys.append(key + (_frame_label(frame.f_code),))
+        elif event == 'c_call':
+            self._keys.append(key + (_builtin_label(arg),))
+        elif len(self._keys) > 1:
+            # return, c_return, c_exception; возвраты из кадров, начатых до start(), пропускаются
+            self._keys.pop()
+        self._last = time.perf_counter()
+
+    def start(self):
+        self._last = time.perf_counter()
+        sys.setprofile(self._profile)
+
+    def stop(self):
+        sys.setprofile(None)
+
+    def collapsed(self):
+        """Строки collapsed stacks с весом в микросекундах"""
+        lines = []
+        for key, seconds in sorted(self.stacks.items()):
+            micros = round(seconds * 1000000)
+            if micros:
+                lines.append(f"{';'.join(key)} {micros}")
+        return lines
+
+
+def requested():
+    """Запрошено ли профилирование и есть ли у пользователя на это права"""
+    flag = request.args.get('__profile') or request.headers.get('X-Profile')
+    return flag == '1' and session.get('role') in ['admin', 'creator']
+
+
+def _start():
+    if requested():
+        g._profiler = StackProfiler()
+        g._profile_started = time.perf_counter()
+        g._profiler.start()
+
+
+def _finish(response):
+    profiler = g.pop('_profiler', None)
+    if profiler is None:
+        return response
+    profiler.stop()
+
+    name = save(profiler.collapsed(), {
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'ms': round((time.perf_counter() - g._profile_started) * 1000, 1),
+        'user': session.get('username')
+    })
+    response.headers['X-Profile-Id'] = name
+    return response
+
+
+def save(lines, meta):
+    """Сохранить снимок на диск и удалить самые старые сверх PROFILE_KEEP"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    now = datetime.now(timezone.utc)
+    endpoint = re.sub(r'[^0-9A-Za-z_]', '_', meta.get('endpoint') or 'unmatched')
+    name = f"{now:%Y%m%d-%H%M%S}-{endpoint}-{uuid.uuid4().hex[:6]}"
+
+    with open(os.path.join(PROFILE_DIR, name + '.collapsed'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    with open(os.path.join(PROFILE_DIR, name + '.json'), 'w', encoding='utf-8') as f:
+        json.dump(dict(meta, name=name, created=now.isoformat(timespec='seconds')), f, ensure_ascii=False)
+
+    for old in list_profiles()[PROFILE_KEEP:]:
+        for suffix in ('.collapsed', '.json'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, old['name'] + suffix))
+            except OSError:
+                pass
+    return name
+
+
+def list_profiles():
+    """Описания сохраненных снимков, новые первыми"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for filename in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if filename.endswith('.json'):
+            try:
+                with open(os.path.join(PROFILE_DIR, filename), encoding='utf-8') as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return profiles
+
+
+def load(name):
+    """(описание, строки collapsed stacks) снимка или None, если его нет"""
+    if not _NAME_RE.match(name):
+        return None
+    try:
+        with open(os.path.join(PROFILE_DIR, name + '.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(os.path.join(PROFILE_DIR, name + '.collapsed'), encoding='utf-8') as f:
+            lines = [line for line in f.read().splitlines() if line]
+    except (OSError, ValueError):
+        return None
+    return meta, lines
+
+
+def flame_tree(lines, min_share=FLAME_MIN_SHARE):
+    """Дерево для flame graph: {'name', 'value', 'share', 'children'}; мелкие узлы отбрасываются"""
+    root = {'name': 'all', 'value': 0, 'children': {}}
+    for line in lines:
+        stack, _, weight = line.rpartition(' ')
+        weight = int(weight)
+        root['value'] += weight
+        node = root
+        for name in stack.split(';'):
+            child = node['children'].get(name)
+            if child is None:
+                child = node['children'][name] = {'name': name, 'value': 0, 'children': {}}
+            child['value'] += weight
+            node = child
+
+    threshold = root['value'] * min_share
+
+    def finish(node, parent_value):
+        children = [finish(child, node['value']) for child in node['children'].values()
+                    if child['value'] >= threshold]
+        children.sort(key=lambda child: -child['value'])
+        # share - ширина узла в процентах от родителя
+        return {'name': node['name'], 'value': node['value'], 'share': node['value'] * 100 / (parent_value or 1),
+                'children': children}
+
+    return finish(root, root['value'])
+
+
+def init_app(app):
+    """Подключить профилирование по ?__profile=1 к приложению"""
+    app.before_request_funcs.setdefault(None, []).insert(0, _start)
+    app.after_request(_finish)
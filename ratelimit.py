@@ -0,0 +1,54 @@
+import time
+
+import database
+
+
+class RateLimited(Exception):
+    """Лимит запросов исчерпан; retry_after - через сколько секунд можно повторить"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f'Rate limit "{name}" exceeded, retry after {retry_after:.1f}s')
+        self.name = name
+        self.retry_after = retry_after
+
+
+def try_acquire(name, rate, burst=1):
+    """Взять токен из ведра name, общего для всех воркеров.
+
+    Ведро хранится в таблице rate_limits и пополняется со скоростью rate токенов
+    в секунду до burst. Возвращает (успех, через сколько секунд появится токен).
+    """
+    # Отдельное соединение из пула: транзакция запроса не должна смешиваться с BEGIN IMMEDIATE
+    conn = database.get_pool().acquire()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        now = time.time()
+        row = conn.execute('SELECT tokens, updated_at FROM rate_limits WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            tokens = burst
+        else:
+            tokens = min(burst, row['tokens'] + max(now - row['updated_at'], 0) * rate)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+
+        conn.execute(
+            'INSERT OR REPLACE INTO rate_limits (name, tokens, updated_at) VALUES (?, ?, ?)',
+            (name, tokens, now)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+def acquire(name, rate, burst=1):
+    """Взять токен или сразу выбросить RateLimited, не дожидаясь пополнения"""
+    allowed, retry_after = try_acquire(name, rate, burst)
+    if not allowed:
+        raise RateLimited(name, retry_after)
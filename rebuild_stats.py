@@ -0,0 +1,22 @@
+import database
+import migrations
+
+
+def rebuild_stats():
+    """Пересчитать агрегированные таблицы из исходных данных"""
+    migrations.migrate()
+
+    print("🔄 Пересчет агрегатов по зонам...")
+    database.rebuild_zone_stats()
+
+    print("🔄 Пересчет сводки по городам...")
+    database.rebuild_city_stats()
+
+    print("🔄 Пересчет счетчиков пользователей...")
+    database.rebuild_user_stats()
+
+    print("✅ Агрегаты пересчитаны")
+
+
+if __name__ == '__main__':
+    rebuild_stats()
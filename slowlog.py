@@ -0,0 +1,151 @@
+"""Журнал медленных SQL-запросов.
+
+Каждый запрос через соединения пула (database.get_db_connection) дольше
+SLOW_QUERY_MS миллисекунд записывается одной JSON-строкой в SLOW_QUERY_LOG:
+время, длительность, текст запроса, форма параметров (типы и длины, без
+значений), маршрут и план EXPLAIN QUERY PLAN. Время включает чтение строк
+(fetch*() и итерацию по курсору), поэтому запись появляется, когда строки
+дочитаны или курсор закрыт. Если результат прочитан не до конца (например,
+fetchone() по запросу с несколькими строками), учитывается только прочитанное.
+
+    python slowlog.py [файл]    - сводка: самые медленные запросы и полные просмотры таблиц
+"""
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import has_request_context, request
+
+import database
+import metrics
+from geocache import LRUCache
+
+# Порог в миллисекундах; отрицательное значение отключает журнал
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG') or os.path.join(
+    os.path.dirname(database.get_db_path()), 'slow_queries.jsonl')
+
+# План одного и того же запроса не пересчитывается чаще раза в PLAN_TTL секунд
+PLAN_CACHE_ENTRIES = 256
+PLAN_TTL = 600
+
+# Для этих операторов EXPLAIN QUERY PLAN имеет смысл
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+slow_queries = metrics.registry.register(metrics.Counter(
+    'db_slow_queries_total', 'SQL-запросы дольше порога журнала медленных запросов', ('route',)))
+
+_plans = LRUCache(PLAN_CACHE_ENTRIES)
+_write_lock = threading.Lock()
+_local = threading.local()
+
+
+def parameter_shape(parameters):
+    """Типы параметров без значений: ['int', 'str(12)'] или {'name': 'str(5)'}"""
+    def shape(value):
+        if isinstance(value, (str, bytes)):
+            return f'{type(value).__name__}({len(value)})'
+        return type(value).__name__
+
+    if parameters is None:
+        return 'executemany'
+    if isinstance(parameters, dict):
+        return {key: shape(value) for key, value in parameters.items()}
+    return [shape(value) for value in parameters]
+
+
+def _caller():
+    if has_request_context():
+        return {'route': request.endpoint or 'unmatched', 'method': request.method, 'path': request.path}
+    return {'script': os.path.basename(sys.argv[0]) if sys.argv else ''}
+
+
+def query_plan(sql, parameters):
+    """Строки EXPLAIN QUERY PLAN (отступ показывает вложенность) или None"""
+    words = sql.split(None, 1)
+    if not words or words[0].upper() not in _EXPLAINABLE or parameters is None:
+        return None
+
+    key = ' '.join(sql.split())
+    hit, plan = _plans.get(key)
+    if hit:
+        return plan
+
+    conn = database.get_pool().acquire()
+    try:
+        rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+    except Exception as e:
+        plan = [f'EXPLAIN недоступен: {e}']
+    else:
+        depth = {0: 0}
+        plan = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, 0) + 1
+            plan.append('  ' * (depth[node_id] - 1) + detail)
+    finally:
+        conn.close()
+
+    _plans.set(key, plan, time.time() + PLAN_TTL)
+    return plan
+
+
+def _on_query(sql, parameters, seconds):
+    if seconds * 1000 < SLOW_QUERY_MS or getattr(_local, 'busy', False):
+        return
+    # EXPLAIN выполняется через тот же пул и не должен сам попадать в журнал
+    _local.busy = True
+    try:
+        caller = _caller()
+        entry = {
+            'at': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'ms': round(seconds * 1000, 2),
+            'sql': ' '.join(sql.split()),
+            'params': parameter_shape(parameters),
+            **caller,
+            'plan': query_plan(sql, parameters)
+        }
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with _write_lock:
+            with open(SLOW_QUERY_LOG, 'a', encoding='utf-8') as f:
+                f.write(line)
+        slow_queries.inc(caller.get('route', 'none'))
+    except Exception:
+        # Журнал не должен ломать сам запрос
+        pass
+    finally:
+        _local.busy = False
+
+
+def enable():
+    """Подключить журнал к соединениям пула (если порог не отрицательный)"""
+    if SLOW_QUERY_MS >= 0:
+        database.add_query_listener(_on_query)
+
+
+def summarize(path, top=20):
+    """Сводка журнала: запросы по суммарному времени и запросы с полным просмотром таблиц"""
+    stats = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            item = stats.setdefault(entry['sql'], {'count': 0, 'total': 0.0, 'max': 0.0, 'routes': set(), 'plan': None})
+            item['count'] += 1
+            item['total'] += entry['ms']
+            item['max'] = max(item['max'], entry['ms'])
+            item['routes'].add(entry.get('route') or entry.get('script') or '')
+            item['plan'] = entry.get('plan') or item['plan']
+
+    for sql, item in sorted(stats.items(), key=lambda pair: -pair[1]['total'])[:top]:
+        scans = [step.strip() for step in item['plan'] or [] if step.strip().startswith('SCAN') and 'CONSTANT ROW' not in step]
+        print(f"⏱️ {item['total']:.1f} мс всего, {item['count']} раз, макс. {item['max']:.1f} мс "
+              f"[{', '.join(sorted(item['routes']))}]")
+        print(f"   {sql[:200]}")
+        for step in scans:
+            print(f"   ⚠️ {step}")
+
+
+if __name__ == '__main__':
+    summarize(sys.argv[1] if len(sys.argv) > 1 else SLOW_QUERY_LOG)
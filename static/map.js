@@ -0,0 +1,214 @@
+// Карта зеленых зон на Leaflet. Разметка страницы статична, а данные карта берет из API:
+// /api/map_data (число зон и их границы) и /api/zones/clusters (кластеры для видимой области)
+var GreenCityMap = (function () {
+    var MARKER_ICON_URL = 'https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-';
+    var MARKER_SHADOW_URL = 'https://cdnjs.cloudflare.com/ajax/libs/leaflet/0.7.7/images/marker-shadow.png';
+
+    // Центр по умолчанию - Москва
+    var DEFAULT_CENTER = [55.7558, 37.6173];
+    var DEFAULT_ZOOM = 5;
+    var CITY_ZOOM = 12;
+
+    // score = null - по зонам еще нет отчетов
+    function healthColor(score) {
+        if (score === null) {
+            return 'grey';
+        } else if (score >= 80) {
+            return 'green';
+        } else if (score >= 60) {
+            return 'orange';
+        }
+        return 'red';
+    }
+
+    function healthText(score) {
+        return score === null ? 'нет отчетов' : score.toFixed(1) + '%';
+    }
+
+    function escapeHtml(value) {
+        return String(value === null || value === undefined ? '' : value)
+            .replace(/&/g, '&amp;')
+            .replace(/</g, '&lt;')
+            .replace(/>/g, '&gt;')
+            .replace(/"/g, '&quot;');
+    }
+
+    function zonePopup(zone, healthScore, color, detailed) {
+        var health = `
+            <p><strong>Состояние:</strong>
+                <span style="color: ${color}; font-weight: bold;">${healthText(healthScore)}</span>
+            </p>`;
+
+        if (!detailed) {
+            return `
+                <div style="min-width: 250px;">
+                    <h5 style="margin: 0 0 10px 0; color: #2c3e50;">
+                        <i class="fas fa-tree"></i> ${escapeHtml(zone.name)}
+                    </h5>
+                    ${health}
+                    <a href="/zone/${zone.id}" target="_blank" class="btn btn-sm btn-primary" style="margin-top: 10px;">
+                        Перейти к зоне
+                    </a>
+                </div>`;
+        }
+
+        return `
+            <div style="min-width: 250px;">
+                <h5 style="margin: 0 0 10px 0; color: #2c3e50;">
+                    <i class="fas fa-tree"></i> ${escapeHtml(zone.name)}
+                </h5>
+                <p><strong>Тип:</strong> ${escapeHtml(zone.zone_type)}</p>
+                <p><strong>Площадь:</strong> ${escapeHtml(zone.area)} га</p>
+                ${health}
+                <p><strong>Задачи:</strong> ${escapeHtml(zone.pending_tasks)}</p>
+                <p><strong>Местоположение:</strong> ${escapeHtml(zone.location)}</p>
+                <a href="/zone/${zone.id}" class="btn btn-sm btn-primary w-100" style="margin-top: 10px;">
+                    <i class="fas fa-external-link-alt me-1"></i>Перейти к зоне
+                </a>
+            </div>`;
+    }
+
+    function zoneMarker(cluster, detailed) {
+        var color = healthColor(cluster.avg_health);
+        var icon = new L.Icon({
+            iconUrl: MARKER_ICON_URL + color + '.png',
+            shadowUrl: MARKER_SHADOW_URL,
+            iconSize: [25, 41],
+            iconAnchor: [12, 41],
+            popupAnchor: [1, -34],
+            shadowSize: [41, 41]
+        });
+
+        var marker = L.marker([cluster.lat, cluster.lon], {icon: icon});
+        marker.bindPopup(zonePopup(cluster.zone, cluster.avg_health, color, detailed));
+        return marker;
+    }
+
+    function clusterMarker(cluster, map) {
+        var size = cluster.count < 10 ? 34 : cluster.count < 100 ? 40 : cluster.count < 1000 ? 48 : 56;
+        var icon = L.divIcon({
+            className: 'zone-cluster',
+            iconSize: [size, size],
+            html: `<div style="width: ${size}px; height: ${size}px; line-height: ${size}px;
+                               border-radius: 50%; text-align: center; font-weight: bold; color: white;
+                               background: ${healthColor(cluster.avg_health)}; opacity: 0.85;
+                               box-shadow: 0 0 0 4px rgba(255, 255, 255, 0.6);">${cluster.count}</div>`
+        });
+
+        var marker = L.marker([cluster.lat, cluster.lon], {icon: icon});
+        marker.bindTooltip(`Зон: ${cluster.count}, среднее состояние: ${healthText(cluster.avg_health)}`);
+        marker.on('click', function () {
+            var b = cluster.bounds;
+            map.fitBounds([[b[1], b[0]], [b[3], b[2]]], {padding: [40, 40]});
+        });
+        return marker;
+    }
+
+    // Подгружает кластеры для видимой области при каждом перемещении карты
+    function attachClusters(map, options) {
+        options = options || {};
+        var layer = L.layerGroup().addTo(map);
+        var requestId = 0;
+
+        function load() {
+            var bounds = map.getBounds();
+            var bbox = [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()].join(',');
+            var current = ++requestId;
+
+            fetch('/api/zones/clusters?z=' + map.getZoom() + '&bbox=' + bbox, {credentials: 'same-origin'})
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    // Ответ на устаревший запрос (карту уже сдвинули) игнорируем
+                    if (current !== requestId) {
+                        return;
+                    }
+                    layer.clearLayers();
+                    data.clusters.forEach(function (cluster) {
+                        var marker = cluster.count === 1
+                            ? zoneMarker(cluster, options.detailed)
+                            : clusterMarker(cluster, map);
+                        marker.addTo(layer);
+                    });
+                })
+                .catch(function (error) {
+                    console.error('Ошибка загрузки зон:', error);
+                });
+        }
+
+        map.on('moveend', load);
+        load();
+        return layer;
+    }
+
+    function addLegend(map) {
+        var legend = L.control({position: 'bottomright'});
+        legend.onAdd = function () {
+            var div = L.DomUtil.create('div', 'legend');
+            div.style.backgroundColor = 'white';
+            div.style.padding = '10px';
+            div.style.borderRadius = '5px';
+            div.style.boxShadow = '0 2px 10px rgba(0,0,0,0.2)';
+            div.innerHTML = `
+                <h5 style="margin: 0 0 8px 0; font-size: 14px;">
+                    <i class="fas fa-tree"></i> Состояние зон
+                </h5>
+                <div style="margin-bottom: 5px;">
+                    <img src="${MARKER_ICON_URL}green.png" style="width: 12px; height: 20px; display: inline-block; margin-right: 5px;">
+                    Отлично (80-100%)
+                </div>
+                <div style="margin-bottom: 5px;">
+                    <img src="${MARKER_ICON_URL}orange.png" style="width: 12px; height: 20px; display: inline-block; margin-right: 5px;">
+                    Хорошо (60-79%)
+                </div>
+                <div>
+                    <img src="${MARKER_ICON_URL}red.png" style="width: 12px; height: 20px; display: inline-block; margin-right: 5px;">
+                    Требует внимания (&lt;60%)
+                </div>`;
+            return div;
+        };
+        legend.addTo(map);
+    }
+
+    // options: tileUrl, maxZoom, detailed (подробные карточки зон), countElement (id счетчика зон)
+    function init(elementId, options) {
+        options = options || {};
+
+        // Инициализация карты с отключенной атрибуцией
+        var map = L.map(elementId, {
+            attributionControl: false
+        }).setView(DEFAULT_CENTER, DEFAULT_ZOOM);
+
+        L.tileLayer(options.tileUrl, {
+            maxZoom: options.maxZoom || 18
+        }).addTo(map);
+
+        addLegend(map);
+        L.control.scale({imperial: false}).addTo(map);
+
+        fetch('/api/map_data', {credentials: 'same-origin'})
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                if (options.countElement) {
+                    document.getElementById(options.countElement).textContent = data.count;
+                }
+                if (data.bounds) {
+                    var b = data.bounds;
+                    map.fitBounds([[b[1], b[0]], [b[3], b[2]]], {maxZoom: CITY_ZOOM, padding: [20, 20], animate: false});
+                }
+            })
+            .catch(function (error) {
+                console.error('Ошибка загрузки данных карты:', error);
+            })
+            .then(function () {
+                attachClusters(map, options);
+            });
+
+        return map;
+    }
+
+    return {
+        init: init,
+        attachClusters: attachClusters,
+        healthColor: healthColor
+    };
+})();
@@ -0,0 +1,54 @@
+import json
+
+from flask import Response, request, stream_with_context
+
+# Размер части ответа: меньшие куски увеличивают число системных вызовов при записи
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Значения параметра ?format= для потоковой выдачи
+STREAM_FORMATS = ('ndjson', 'stream')
+
+
+def requested_format():
+    """Запрошенный формат списка: 'json' (по умолчанию), 'ndjson' или 'stream' (JSON-массив по частям)"""
+    value = request.args.get('format', 'json')
+    return value if value in STREAM_FORMATS else 'json'
+
+
+def json_stream(items, ndjson=False):
+    """Потоковый ответ из итератора: NDJSON (объект на строку) или JSON-массив.
+
+    Элементы кодируются по мере чтения, поэтому в памяти воркера нет ни всего
+    списка, ни всей JSON-строки. Генератор выполняется в контексте запроса,
+    и соединение с БД освобождается только после отправки последней части.
+    """
+    def dumps(item):
+        # Компактно и без \u-экранирования кириллицы, как geojson.dumps
+        return json.dumps(item, ensure_ascii=False, separators=(',', ':'))
+
+    def generate():
+        buffer = [] if ndjson else ['[']
+        size = 0
+        first = True
+        for item in items:
+            chunk = dumps(item)
+            if ndjson:
+                chunk += '\n'
+            elif not first:
+                chunk = ',' + chunk
+            first = False
+
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= STREAM_CHUNK_SIZE:
+                yield ''.join(buffer)
+                buffer = []
+                size = 0
+
+        if not ndjson:
+            buffer.append(']')
+        if buffer:
+            yield ''.join(buffer)
+
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
@@ -0,0 +1,75 @@
+import pytest
+
+import zonebin
+
+
+def zone(zone_id, lat, lon, zone_type='Парк', avg_health=50.0):
+    return {'id': zone_id, 'lat': lat, 'lon': lon, 'zone_type': zone_type, 'avg_health': avg_health}
+
+
+def assert_round_trip(zones):
+    decoded = zonebin.decode(zonebin.encode(zones))
+    originals = sorted(zones, key=lambda item: item['id'])
+    assert [item['id'] for item in decoded] == [item['id'] for item in originals]
+
+    coordinate_step = 1 / zonebin.COORDINATE_SCALE
+    for original, item in zip(originals, decoded):
+        if original['lat'] is None or original['lon'] is None:
+            assert item['lat'] is None and item['lon'] is None
+        else:
+            assert abs(item['lat'] - original['lat']) <= coordinate_step / 2 + 1e-12
+            assert abs(item['lon'] - original['lon']) <= coordinate_step / 2 + 1e-12
+        assert item['type'] == (original['zone_type'] or '')
+    return originals, decoded
+
+
+def test_round_trip_with_missing_and_negative_coordinates():
+    zones = [
+        zone(7, 67.5660123, 30.4670456, 'Сквер', 72.3),
+        zone(3, 53.3481, 83.7798, 'Парк', 0),
+        zone(12, None, None, 'Газон', 40.0),
+        zone(15, 55.1, None, 'Газон', 41.0),
+        # Отрицательные координаты и разности с предыдущей точкой
+        zone(20, -33.8688, -151.2093, 'Аллея', 99.9),
+        zone(21, -34.0, 151.0, None, 10.25),
+        zone(1000, 0.0000004, -0.0000006, 'Парк', 55.5),
+    ]
+    originals, decoded = assert_round_trip(zones)
+
+    for original, item in zip(originals, decoded):
+        assert abs(item['health'] - original['avg_health']) <= 0.5 / 2 + 1e-9
+
+
+def test_health_is_clamped_below_the_unknown_marker_at_half_point_step():
+    zones = [
+        zone(1, 1.0, 1.0, avg_health=-5),
+        zone(2, 1.0, 1.0, avg_health=0),
+        zone(3, 1.0, 1.0, avg_health=127.5),
+        zone(4, 1.0, 1.0, avg_health=200),
+        zone(5, 1.0, 1.0, avg_health=33.74),
+    ]
+    decoded = zonebin.decode(zonebin.encode(zones))
+    assert [item['health'] for item in decoded] == [0, 0, 127, 127, 33.5]
+
+
+def test_zone_without_reports_round_trips_as_none():
+    zones = [
+        zone(1, 1.0, 1.0, avg_health=None),
+        # Строки БД: avg_health = 0 и для зон без отчетов, отличаются по health_count
+        dict(zone(2, 1.0, 1.0, avg_health=0), health_count=0),
+        dict(zone(3, 1.0, 1.0, avg_health=0), health_count=2),
+        dict(zone(4, 1.0, 1.0, avg_health=64.5), health_count=1),
+    ]
+    decoded = zonebin.decode(zonebin.encode(zones))
+    assert [item['health'] for item in decoded] == [None, None, 0, 64.5]
+
+
+def test_empty_list():
+    assert zonebin.decode(zonebin.encode([])) == []
+
+
+def test_rejects_unknown_format():
+    data = bytearray(zonebin.encode([zone(1, 1.0, 1.0)]))
+    data[3] = zonebin.FORMAT_VERSION + 1
+    with pytest.raises(ValueError):
+        zonebin.decode(bytes(data))
@@ -0,0 +1,438 @@
+"""Трассировка запросов: дерево спанов на каждый отобранный запрос.
+
+Спаны: обработчик маршрута (корень), вызовы функций database.*, отдельные
+SQL-запросы, рендеринг шаблонов и HTTP-запросы MapService к геокодеру.
+Отбирается доля TRACE_SAMPLE_RATE запросов, а также запросы с заголовком
+W3C traceparent с флагом sampled от адресов из TRACE_TRUSTED_UPSTREAMS
+(от остальных клиентов traceparent только связывает трассы, а решение об
+отборе принимается по TRACE_SAMPLE_RATE). Готовые трассы фоновый поток пишет
+одной JSON-строкой в TRACE_LOG и, если задан TRACE_OTLP_URL, отправляет
+в коллектор в формате OTLP/HTTP JSON.
+
+    python tracing.py show [файл] [число]     - последние трассы деревом, * - критический путь
+    python tracing.py collect [порт] [файл]   - простой коллектор OTLP/HTTP JSON (POST /v1/traces)
+"""
+import inspect
+import ipaddress
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from flask import before_render_template, g, request, template_rendered
+
+import database
+
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0))
+TRACE_LOG = os.environ.get('TRACE_LOG') or os.path.join(os.path.dirname(database.get_db_path()), 'traces.jsonl')
+TRACE_OTLP_URL = os.environ.get('TRACE_OTLP_URL')
+# Адреса и подсети (через запятую), чьему флагу sampled в traceparent можно доверять
+TRACE_TRUSTED_UPSTREAMS = tuple(
+    ipaddress.ip_network(item.strip(), strict=False)
+    for item in os.environ.get('TRACE_TRUSTED_UPSTREAMS', '').split(',') if item.strip()
+)
+SERVICE_NAME = 'green-city'
+
+# Очередь экспорта; при переполнении трассы отбрасываются, а не задерживают запросы
+EXPORT_QUEUE_SIZE = 1000
+# Длинные тексты SQL в атрибутах обрезаются
+MAX_STATEMENT_LENGTH = 500
+
+# Служебные функции database, которые не оборачиваются в спаны
+UNTRACED_DATABASE_FUNCTIONS = (
+    'get_db_path', 'get_db_connection', 'get_pool', 'close_request_connection', 'init_app',
+    'add_query_listener', 'hash_password', 'verify_password'
+)
+
+_TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current = ContextVar('trace', default=None)
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start', 'end', 'attributes', 'error')
+
+    def __init__(self, trace_id, parent_id, name, attributes, start=None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start = start or time.time_ns()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+    def to_dict(self):
+        return {
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'ms': round((self.end - self.start) / 1000000, 3),
+            'attributes': self.attributes,
+            'error': self.error
+        }
+
+
+class Trace:
+    """Спаны одного запроса; stack - открытые спаны от корня к текущему"""
+
+    def __init__(self, trace_id=None, parent_id=None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.parent_id = parent_id
+        self.spans = []
+        self.stack = []
+
+    def open(self, name, attributes):
+        parent = self.stack[-1].span_id if self.stack else self.parent_id
+        span = Span(self.trace_id, parent, name, attributes)
+        self.spans.append(span)
+        self.stack.append(span)
+        return span
+
+    def close(self, span, error=None):
+        span.end = time.time_ns()
+        if error is not None:
+            span.error = f'{type(error).__name__}: {error}'
+        # Незакрытые вложенные спаны (например, шаблон, упавший при рендеринге) закрываются вместе с родителем
+        while self.stack:
+            top = self.stack.pop()
+            if top.end is None:
+                top.end = span.end
+            if top is span:
+                break
+
+    def add_finished(self, name, attributes, seconds):
+        """Спан уже завершенной операции длительностью seconds"""
+        end = time.time_ns()
+        parent = self.stack[-1].span_id if self.stack else self.parent_id
+        span = Span(self.trace_id, parent, name, attributes, start=end - int(seconds * 1000000000))
+        span.end = end
+        self.spans.append(span)
+
+
+class span:
+    """Контекстный менеджер спана; вне отобранной трассы ничего не делает"""
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self._span = None
+
+    def __enter__(self):
+        trace = _current.get()
+        if trace is not None:
+            self._span = trace.open(self.name, self.attributes)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is not None:
+            _current.get().close(self._span, exc)
+        return False
+
+
+def traced(function, name=None):
+    """Обернуть функцию в спан name (по умолчанию модуль.функция)"""
+    name = name or f'{function.__module__}.{function.__name__}'
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        trace = _current.get()
+        if trace is None:
+            return function(*args, **kwargs)
+        current = trace.open(name, {})
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as e:
+            trace.close(current, e)
+            raise
+        trace.close(current)
+        return result
+
+    wrapper.__traced__ = True
+    return wrapper
+
+
+def instrument_module(module, exclude=()):
+    """Обернуть в спаны все открытые функции модуля (вызовы внутри модуля тоже попадают в трассу).
+
+    Функции-генераторы пропускаются: спан закрылся бы при создании генератора, а не после
+    чтения; их SQL-запросы и так попадают в трассу вместе со временем чтения строк.
+    """
+    for attribute, value in list(vars(module).items()):
+        if (attribute.startswith('_') or attribute in exclude or not callable(value) or isinstance(value, type)
+                or getattr(value, '__module__', None) != module.__name__ or getattr(value, '__traced__', False)
+                or inspect.isgeneratorfunction(value)):
+            continue
+        setattr(module, attribute, traced(value))
+
+
+# Экспорт
+
+
+_exporter = {'queue': None, 'pid': None}
+_exporter_lock = threading.Lock()
+
+
+def _export_queue():
+    # Поток экспорта запускается заново в каждом воркере после fork
+    if _exporter['pid'] != os.getpid():
+        with _exporter_lock:
+            if _exporter['pid'] != os.getpid():
+                _exporter['queue'] = queue.Queue(EXPORT_QUEUE_SIZE)
+                _exporter['pid'] = os.getpid()
+                threading.Thread(target=_export_loop, args=(_exporter['queue'],), daemon=True).start()
+    return _exporter['queue']
+
+
+def _attribute_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(records):
+    """Трассы (словари из TRACE_LOG) в теле запроса OTLP/HTTP JSON"""
+    spans = []
+    for record in records:
+        for item in record['spans']:
+            otlp = {
+                'traceId': record['trace_id'],
+                'spanId': item['span_id'],
+                'name': item['name'],
+                'kind': 2 if item['parent_id'] == record.get('parent_id') else 1,
+                'startTimeUnixNano': str(item['start']),
+                'endTimeUnixNano': str(item['start'] + round(item['ms'] * 1000000)),
+                'attributes': [{'key': key, 'value': _attribute_value(value)}
+                               for key, value in item['attributes'].items()],
+                'status': {'code': 2, 'message': item['error']} if item['error'] else {'code': 1}
+            }
+            if item['parent_id']:
+                otlp['parentSpanId'] = item['parent_id']
+            spans.append(otlp)
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeSpans': [{'scope': {'name': 'tracing'}, 'spans': spans}]
+    }]}
+
+
+def _export_loop(records):
+    while True:
+        batch = [records.get()]
+        while len(batch) < 100:
+            try:
+                batch.append(records.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            with open(TRACE_LOG, 'a', encoding='utf-8') as f:
+                for record in batch:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            if TRACE_OTLP_URL:
+                import requests
+                requests.post(TRACE_OTLP_URL, json=to_otlp(batch), timeout=5)
+        except Exception:
+            # Экспорт не должен останавливать поток; трассы пакета теряются
+            pass
+
+
+def export(trace):
+    """Поставить завершенную трассу в очередь экспорта"""
+    root = trace.spans[0]
+    record = {
+        'trace_id': trace.trace_id,
+        'parent_id': trace.parent_id,
+        'name': root.name,
+        'ms': round((root.end - root.start) / 1000000, 3),
+        'spans': [item.to_dict() for item in trace.spans if item.end is not None]
+    }
+    try:
+        _export_queue().put_nowait(record)
+    except queue.Full:
+        pass
+
+
+# Подключение к Flask и БД
+
+
+def _trusted_upstream():
+    """Пришел ли запрос от адреса из TRACE_TRUSTED_UPSTREAMS"""
+    if not TRACE_TRUSTED_UPSTREAMS or not request.remote_addr:
+        return False
+    try:
+        address = ipaddress.ip_address(request.remote_addr)
+    except ValueError:
+        return False
+    return any(address in network for network in TRACE_TRUSTED_UPSTREAMS)
+
+
+def _should_sample():
+    """(trace_id, parent_id) входящего traceparent и решение об отборе.
+
+    Флаг sampled принимается только от доверенных адресов: иначе любой клиент
+    мог бы включить трассировку и экспорт для всех своих запросов.
+    """
+    sampled = TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+    match = _TRACEPARENT_RE.match(request.headers.get('traceparent', ''))
+    if match:
+        if _trusted_upstream():
+            sampled = int(match.group(3), 16) & 1 == 1
+        return match.group(1), match.group(2), sampled
+    return None, None, sampled
+
+
+def _start_request():
+    trace_id, parent_id, sampled = _should_sample()
+    if not sampled:
+        return
+    trace = Trace(trace_id, parent_id)
+    rule = request.url_rule.rule if request.url_rule else request.path
+    g._trace_root = trace.open(f'{request.method} {rule}', {
+        'http.method': request.method,
+        'http.route': rule,
+        'http.target': request.full_path.rstrip('?')
+    })
+    _current.set(trace)
+
+
+def _record_status(response):
+    root = g.get('_trace_root')
+    if root is not None:
+        root.attributes['http.status_code'] = response.status_code
+        response.headers['traceparent'] = f'00-{root.trace_id}-{root.span_id}-01'
+    return response
+
+
+def _finish_request(exc=None):
+    root = g.pop('_trace_root', None)
+    if root is None:
+        return
+    trace = _current.get()
+    trace.close(root, exc)
+    _current.set(None)
+    export(trace)
+
+
+def _on_query(sql, parameters, seconds):
+    trace = _current.get()
+    if trace is not None:
+        words = sql.split(None, 1)
+        trace.add_finished('sql ' + (words[0].upper() if words else ''), {
+            'db.system': 'sqlite',
+            'db.statement': ' '.join(sql.split())[:MAX_STATEMENT_LENGTH]
+        }, seconds)
+
+
+def _template_started(sender, template, context, **extra):
+    trace = _current.get()
+    if trace is not None:
+        trace.open(f'render {template.name}', {'template': template.name})
+
+
+def _template_finished(sender, template, context, **extra):
+    trace = _current.get()
+    if trace is not None and trace.stack and trace.stack[-1].name == f'render {template.name}':
+        trace.close(trace.stack[-1])
+
+
+def init_app(app):
+    """Подключить трассировку к приложению, функциям database и SQL-запросам"""
+    instrument_module(database, UNTRACED_DATABASE_FUNCTIONS)
+    database.add_query_listener(_on_query)
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+
+
+# Просмотр и коллектор
+
+
+def critical_path(spans):
+    """span_id спанов критического пути: от корня к дочернему спану, который завершился последним"""
+    children = {}
+    for item in spans:
+        children.setdefault(item['parent_id'], []).append(item)
+    ids = {item['span_id'] for item in spans}
+    path = set()
+    current = next((item for item in spans if item['parent_id'] not in ids), None)
+    while current is not None:
+        path.add(current['span_id'])
+        kids = children.get(current['span_id'])
+        current = max(kids, key=lambda item: item['start'] + item['ms'] * 1000000) if kids else None
+    return path
+
+
+def show(path, count=5):
+    """Вывести последние трассы деревом с отступом начала и длительностью спанов"""
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()][-count:]
+
+    for record in records:
+        spans = record['spans']
+        on_path = critical_path(spans)
+        children = {}
+        for item in spans:
+            children.setdefault(item['parent_id'], []).append(item)
+        ids = {item['span_id'] for item in spans}
+        start = min(item['start'] for item in spans)
+        print(f"🧵 {record['trace_id']} {record['name']} - {record['ms']} мс")
+
+        def walk(item, depth):
+            mark = '*' if item['span_id'] in on_path else ' '
+            offset = (item['start'] - start) / 1000000
+            detail = item['attributes'].get('db.statement', '')[:80]
+            error = f" ❌ {item['error']}" if item['error'] else ''
+            print(f"  {mark} {offset:8.2f} {item['ms']:8.2f} мс {'  ' * depth}{item['name']} {detail}{error}")
+            for child in sorted(children.get(item['span_id'], []), key=lambda child: child['start']):
+                walk(child, depth + 1)
+
+        for root in [item for item in spans if item['parent_id'] not in ids]:
+            walk(root, 0)
+
+
+def collect(port, path):
+    """Коллектор-заглушка: принимает OTLP/HTTP JSON и дописывает тела запросов в файл"""
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.path != '/v1/traces':
+                self.send_response(404)
+                self.end_headers()
+                return
+            spans = sum(len(scope['spans']) for resource in json.loads(body)['resourceSpans']
+                        for scope in resource['scopeSpans'])
+            with open(path, 'ab') as f:
+                f.write(body + b'\n')
+            print(f"📥 Получено спанов: {spans}")
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, format, *args):
+            pass
+
+    print(f"🛰️ Коллектор слушает http://127.0.0.1:{port}/v1/traces, запись в {path}")
+    HTTPServer(('127.0.0.1', port), Handler).serve_forever()
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'show'
+    if command == 'collect':
+        collect(int(sys.argv[2]) if len(sys.argv) > 2 else 4318, sys.argv[3] if len(sys.argv) > 3 else 'otlp.jsonl')
+    else:
+        show(sys.argv[2] if len(sys.argv) > 2 else TRACE_LOG, int(sys.argv[3]) if len(sys.argv) > 3 else 5)
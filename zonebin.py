@@ -0,0 +1,169 @@
+"""Компактный бинарный формат списка зон (/api/zones.bin).
+
+Все целые числа - беззнаковые varint (LEB128), знаковые - zigzag + varint.
+Данные хранятся по столбцам, зоны упорядочены по id:
+
+    magic       b'GCZ' и байт версии формата (2)
+    count       число зон N
+    types       число строк T, затем T строк (длина в байтах + UTF-8) - типы зон
+    ids         N id: первый как есть, остальные - разница с предыдущим
+    has_point   ceil(N / 8) байт: бит i (младший бит первым) - есть ли у зоны координаты
+    lat, lon    для зон с координатами: микроградусы, разница с предыдущей точкой (zigzag)
+    type        N индексов в таблице types
+    health      N байт: средняя оценка состояния * 2 (шаг 0.5, от 0 до 254);
+                255 - по зоне нет отчетов (оценка неизвестна, а не нулевая)
+
+Версия 2: байт 255 стал признаком "нет отчетов", раньше зоны без отчетов
+кодировались оценкой 0.
+"""
+import sys
+
+MAGIC = b'GCZ'
+FORMAT_VERSION = 2
+MIMETYPE = 'application/octet-stream'
+
+# Координаты хранятся в микроградусах (около 0.1 м)
+COORDINATE_SCALE = 1000000
+HEALTH_SCALE = 2
+HEALTH_MAX_BYTE = 254
+HEALTH_UNKNOWN = 255
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_signed(out, value):
+    _write_varint(out, (value << 1) ^ (value >> 63))
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _read_signed(data, pos):
+    value, pos = _read_varint(data, pos)
+    return (value >> 1) ^ -(value & 1), pos
+
+
+def _health_byte(zone):
+    # В строках get_approved_zones_for_city avg_health = 0 и для зон без отчетов,
+    # поэтому отсутствие оценки определяем по health_count, если он есть
+    if zone['avg_health'] is None or ('health_count' in zone.keys() and not zone['health_count']):
+        return HEALTH_UNKNOWN
+    return min(max(round(zone['avg_health'] * HEALTH_SCALE), 0), HEALTH_MAX_BYTE)
+
+
+def encode(zones):
+    """Закодировать зоны (id, lat, lon, zone_type, avg_health и необязательный health_count) в байты"""
+    zones = sorted(zones, key=lambda zone: zone['id'])
+    out = bytearray(MAGIC)
+    out.append(FORMAT_VERSION)
+    _write_varint(out, len(zones))
+
+    types = {}
+    for zone in zones:
+        types.setdefault(zone['zone_type'] or '', len(types))
+    _write_varint(out, len(types))
+    for name in types:
+        encoded = name.encode('utf-8')
+        _write_varint(out, len(encoded))
+        out += encoded
+
+    previous = 0
+    for zone in zones:
+        _write_varint(out, zone['id'] - previous)
+        previous = zone['id']
+
+    has_point = bytearray((len(zones) + 7) // 8)
+    points = []
+    for i, zone in enumerate(zones):
+        if zone['lat'] is not None and zone['lon'] is not None:
+            has_point[i // 8] |= 1 << (i % 8)
+            points.append((round(zone['lat'] * COORDINATE_SCALE), round(zone['lon'] * COORDINATE_SCALE)))
+    out += has_point
+
+    for axis in (0, 1):
+        previous = 0
+        for point in points:
+            _write_signed(out, point[axis] - previous)
+            previous = point[axis]
+
+    for zone in zones:
+        _write_varint(out, types[zone['zone_type'] or ''])
+
+    out += bytes(_health_byte(zone) for zone in zones)
+    return bytes(out)
+
+
+def decode(data):
+    """Эталонный декодер: список словарей id, lat, lon, type, health (None - нет отчетов)"""
+    if data[:3] != MAGIC or data[3] != FORMAT_VERSION:
+        raise ValueError('Неизвестный формат данных')
+    pos = 4
+    count, pos = _read_varint(data, pos)
+
+    type_count, pos = _read_varint(data, pos)
+    types = []
+    for _ in range(type_count):
+        length, pos = _read_varint(data, pos)
+        types.append(data[pos:pos + length].decode('utf-8'))
+        pos += length
+
+    ids = []
+    previous = 0
+    for _ in range(count):
+        delta, pos = _read_varint(data, pos)
+        previous += delta
+        ids.append(previous)
+
+    bitmap_size = (count + 7) // 8
+    has_point = [bool(data[pos + i // 8] & (1 << (i % 8))) for i in range(count)]
+    pos += bitmap_size
+    point_count = sum(has_point)
+
+    axes = []
+    for _ in (0, 1):
+        values = []
+        previous = 0
+        for _ in range(point_count):
+            delta, pos = _read_signed(data, pos)
+            previous += delta
+            values.append(previous / COORDINATE_SCALE)
+        axes.append(values)
+
+    zone_types = []
+    for _ in range(count):
+        index, pos = _read_varint(data, pos)
+        zone_types.append(types[index])
+
+    health = [None if value == HEALTH_UNKNOWN else value / HEALTH_SCALE for value in data[pos:pos + count]]
+
+    zones = []
+    point = 0
+    for i in range(count):
+        lat = lon = None
+        if has_point[i]:
+            lat, lon = axes[0][point], axes[1][point]
+            point += 1
+        zones.append({'id': ids[i], 'lat': lat, 'lon': lon, 'type': zone_types[i], 'health': health[i]})
+    return zones
+
+
+if __name__ == '__main__':
+    # python zonebin.py zones.bin - вывести содержимое файла в JSON
+    import json
+
+    with open(sys.argv[1], 'rb') as f:
+        print(json.dumps(decode(f.read()), ensure_ascii=False, indent=2))